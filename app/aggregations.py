@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+# Agregações do dashboard calculadas em memória (modo pandas)
+# Devolvem o mesmo formato de queries.fetch_aggregates
+# observed=True: colunas category só geram grupos para combinações presentes
+# Os gráficos recebem sempre dados já reduzidos: bins do histograma, top N cidades por estado e série reamostrada
+
+# Cidades por estado no gráfico geográfico; as demais somam em "Outras"
+TOP_CITIES = 10
+OTHERS_LABEL = 'Outras'
+
+# Granularidade da série pelo tamanho do período: até ~3 meses por dia, até 2 anos por semana, acima disso por mês
+# (frequência do pandas, unidade do DATE_TRUNC no Postgres); semanas começam na segunda-feira nos dois
+TIME_GRAINS = {'dia': ('D', 'day'), 'semana': ('W', 'week'), 'mes': ('M', 'month')}
+
+def time_grain(inicio, fim):
+    dias = (pd.Timestamp(fim) - pd.Timestamp(inicio)).days + 1
+    if dias <= 92:
+        return 'dia'
+    if dias <= 731:
+        return 'semana'
+    return 'mes'
+
+def resample_series(df_time, grao):
+    # df_time: data_escrituracao (datetime64) e qtd_notas por dia
+    if grao != 'dia':
+        inicio = df_time['data_escrituracao'].dt.to_period(TIME_GRAINS[grao][0]).dt.start_time
+        df_time = df_time.groupby(inicio)['qtd_notas'].sum().reset_index()
+    return df_time.assign(granularidade=grao)
+
+def top_cities(df_geo, top=TOP_CITIES):
+    # Mantém as `top` cidades de maior volume em cada estado e agrupa o restante em OTHERS_LABEL
+    posicao = df_geo.groupby('estado_fornecedor', observed=True)['volume_notas'].rank(method='first', ascending=False)
+    cidade = df_geo['cidade_fornecedor'].astype(object).where(posicao <= top, OTHERS_LABEL)
+    return (
+        df_geo.assign(cidade_fornecedor=cidade)
+        .groupby(['estado_fornecedor', 'cidade_fornecedor'], observed=True)['volume_notas'].sum().reset_index()
+    )
+
+def apply_filters(df, filtros):
+    # APLICAÇÃO DOS FILTROS (PANDAS)
+    # data_escrituracao é datetime64 (meia-noite); os limites chegam como datetime.date
+    inicio, fim = pd.Timestamp(filtros['periodo'][0]), pd.Timestamp(filtros['periodo'][1])
+    mask = (
+        (df['data_escrituracao'] >= inicio) &
+        (df['data_escrituracao'] <= fim) &
+        (df['tipo_nota'].isin(filtros['tipo_nota'])) &
+        (df['nome_tarefa'].isin(filtros['nome_tarefa'])) &
+        (df['status_tarefa'].isin(filtros['status_tarefa'])) &
+        (df['estado_fornecedor'].isin(filtros['estado_fornecedor']))
+    )
+    return df.loc[mask]
+
+def lead_time_histogram(lead_times, nbins=20):
+    valores = lead_times.dropna().to_numpy()
+    if len(valores) == 0:
+        return pd.DataFrame(columns=['inicio', 'fim', 'contagem'])
+    contagem, bordas = np.histogram(valores, bins=nbins)
+    return pd.DataFrame({'inicio': bordas[:-1], 'fim': bordas[1:], 'contagem': contagem})
+
+def kpis(df_filtered):
+    return {
+        'total_gasto': df_filtered['total_value'].sum(),
+        'qtd_notas': df_filtered['id'].count(),
+        'lead_time_medio': df_filtered['lead_time_horas'].mean(),
+        'qtd_fornecedores': df_filtered['cnpj_fornecedor'].nunique(),
+    }
+
+def pareto(df_filtered, top=10):
+    df_pareto = df_filtered.groupby('cnpj_formatado', observed=True)['total_value'].sum().reset_index()
+    return df_pareto.sort_values(by='total_value', ascending=False).head(top)
+
+def geo(df_filtered, top=TOP_CITIES):
+    df_geo = df_filtered.groupby(['estado_fornecedor', 'cidade_fornecedor'], observed=True).size().reset_index(name='volume_notas')
+    return top_cities(df_geo, top)
+
+def daily_series(df_filtered, grao=None):
+    # Sem granularidade informada, usa o intervalo de datas presente no recorte
+    df_time = df_filtered.groupby('data_escrituracao')['id'].count().reset_index(name='qtd_notas')
+    if grao is None:
+        grao = time_grain(df_time['data_escrituracao'].min(), df_time['data_escrituracao'].max()) if len(df_time) else 'dia'
+    return resample_series(df_time, grao)
+
+def compute_aggregates(df_filtered, nbins=20, filtros=None):
+    return {
+        'kpis': kpis(df_filtered),
+        'pareto': pareto(df_filtered),
+        'geo': geo(df_filtered),
+        'hist': lead_time_histogram(df_filtered['lead_time_horas'], nbins),
+        'diario': daily_series(df_filtered, time_grain(*filtros['periodo']) if filtros else None),
+    }
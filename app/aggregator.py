@@ -0,0 +1,209 @@
+import io
+import json
+import time
+import select
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.error import HTTPError
+from urllib.request import urlopen
+import numpy as np
+import pandas as pd
+import psycopg2
+from sqlalchemy.exc import OperationalError
+import queries
+import cube
+from db import get_engine
+from enrichment import enrich
+
+# Agregador do dashboard alimentado por eventos (init_scripts/06_change_events.sql)
+# O JOIN completo roda uma única vez, na partida; depois cada NOTIFY traz os IDs das tarefas alteradas,
+# que são relidas pela chave primária e aplicadas ao cubo (subtrai o estado antigo, soma o novo)
+# Os dashboards (DASHBOARD_BACKEND=aggregator) baixam o cubo publicado, só quando a versão muda
+# python aggregator.py --porta 8765
+
+CHANNEL = 'dashboard_changes'
+
+# Colunas guardadas por tarefa: o suficiente para recalcular a contribuição dela no cubo
+STATE_COLUMNS = ['id', 'total_value', 'lead_time_horas'] + cube.CUBE_KEYS
+
+# Tarefas relidas por consulta e limite de IDs acumulados antes de aplicar
+FETCH_CHUNK = 10_000
+MAX_PENDING = 100_000
+
+def new_state():
+    return {
+        'df': None, 'cubo': None, 'versao': 0, 'atualizado_em': None, 'eventos': 0,
+        'tabelas': None, 'lock': threading.Lock(),
+    }
+
+def _to_parquet(df):
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+def publish(estado, df, cubo):
+    # Serializa uma vez por versão; as requisições só devolvem os bytes prontos
+    tabelas = {'linhas': _to_parquet(cubo['linhas']), 'hist': _to_parquet(cubo['hist'])}
+    with estado['lock']:
+        estado['df'], estado['cubo'], estado['tabelas'] = df, cubo, tabelas
+        estado['versao'] += 1
+        estado['atualizado_em'] = time.time()
+
+def bootstrap(engine, estado):
+    """Carga completa (o JOIN pesado), indexada por task_id"""
+    df = enrich(queries.get_full_data(engine)).set_index('task_id')[STATE_COLUMNS]
+    publish(estado, df, cube.build_cube(df))
+    print(f"🧊 Cubo inicial: {len(df)} tarefas, {len(estado['cubo']['linhas'])} grupos")
+
+def _fetch(engine, task_ids, vazio):
+    # Estado atual das tarefas no banco; as removidas não voltam
+    ids = sorted(task_ids)
+    partes = [queries.get_rows_by_task_ids(engine, ids[i:i + FETCH_CHUNK]) for i in range(0, len(ids), FETCH_CHUNK)]
+    partes = [p for p in partes if not p.empty]
+    if not partes:
+        return vazio
+    return enrich(pd.concat(partes, ignore_index=True)).set_index('task_id')[STATE_COLUMNS]
+
+def _align_categories(base, novas):
+    # Mesmas categorias nos dois frames: o concat mantém category sem recodificar o frame inteiro
+    for coluna in STATE_COLUMNS:
+        if isinstance(base[coluna].dtype, pd.CategoricalDtype):
+            faltantes = pd.Index(novas[coluna].dropna().unique()).difference(base[coluna].cat.categories)
+            if len(faltantes):
+                base[coluna] = base[coluna].cat.add_categories(faltantes)
+            novas[coluna] = pd.Categorical(novas[coluna], categories=base[coluna].cat.categories)
+    return base, novas
+
+def apply_changes(engine, estado, task_ids):
+    """Relê as tarefas alteradas e ajusta o cubo. Idempotente: aplicar o mesmo evento duas vezes não muda nada"""
+    df = estado['df']
+    ids = pd.Index(list(task_ids))
+    novas = _fetch(engine, ids, df.iloc[0:0])
+    antigas = df[df.index.isin(ids)]
+
+    cubo = cube.apply_delta(estado['cubo'], novas, antigas)
+    base, novas = _align_categories(df[~df.index.isin(ids)].copy(), novas.copy())
+    publish(estado, pd.concat([base, novas]), cubo)
+    return len(antigas), len(novas)
+
+def _listen_session(engine, estado, debounce, timeout):
+    raw = engine.raw_connection()
+    try:
+        conn = raw.driver_connection
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {CHANNEL}")
+
+        # Na partida e a cada reconexão: os eventos de quando não havia LISTEN se perderam
+        bootstrap(engine, estado)
+
+        pendentes = set()
+        while True:
+            # Com eventos pendentes, espera só um intervalo curto sem novas mensagens antes de aplicar
+            prontos, _, _ = select.select([conn], [], [], debounce if pendentes else timeout)
+            if prontos:
+                conn.poll()
+                while conn.notifies:
+                    evento = json.loads(conn.notifies.pop(0).payload)
+                    pendentes.update(evento['task_ids'])
+                    estado['eventos'] += 1
+                if len(pendentes) < MAX_PENDING:
+                    continue
+
+            if pendentes:
+                inicio = time.perf_counter()
+                removidas, lidas = apply_changes(engine, estado, pendentes)
+                print(f"   🔁 {len(pendentes)} tarefas ({removidas} antigas, {lidas} atuais) em "
+                      f"{time.perf_counter() - inicio:.2f}s -> versão {estado['versao']}")
+                pendentes = set()
+    finally:
+        # A conexão do LISTEN (viva ou quebrada) não volta para o pool
+        raw.invalidate()
+
+def listen(engine, estado, debounce=0.5, timeout=5.0, espera=5.0):
+    """LISTEN antes da carga inicial (nada se perde entre a carga e o primeiro evento); depois aplica os eventos em lotes"""
+    # Se o Postgres cair ou reiniciar, reconecta, refaz o LISTEN e recarrega o cubo;
+    # enquanto isso o servidor HTTP continua entregando a última versão publicada
+    while True:
+        try:
+            _listen_session(engine, estado, debounce, timeout)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError, OperationalError) as e:
+            print(f"⚠️ Conexão com o banco perdida ({e.__class__.__name__}); reconectando em {espera:.0f}s")
+            time.sleep(espera)
+
+def make_handler(estado):
+    class Handler(BaseHTTPRequestHandler):
+        # GET /status                       -> versão, faixas do histograma e contadores
+        # GET /cubo/<versao>/linhas.parquet -> linhas do cubo (409 se a versão já mudou)
+        # GET /cubo/<versao>/hist.parquet   -> histograma do cubo
+        def do_GET(self):
+            with estado['lock']:
+                versao, cubo, tabelas = estado['versao'], estado['cubo'], estado['tabelas']
+                status = {
+                    'versao': versao, 'atualizado_em': estado['atualizado_em'], 'eventos': estado['eventos'],
+                    'tarefas': 0 if estado['df'] is None else len(estado['df']),
+                    'bordas': None if cubo is None else cubo['bordas'].tolist(),
+                }
+
+            partes = self.path.strip('/').split('/')
+            if partes == ['status']:
+                self._send(200, json.dumps(status).encode(), 'application/json')
+            elif len(partes) == 3 and partes[0] == 'cubo' and partes[2] in ('linhas.parquet', 'hist.parquet'):
+                if tabelas is None or partes[1] != str(versao):
+                    self._send(409, b'versao desatualizada', 'text/plain')
+                else:
+                    self._send(200, tabelas[partes[2].split('.')[0]], 'application/vnd.apache.parquet')
+            else:
+                self._send(404, b'nao encontrado', 'text/plain')
+
+        def _send(self, codigo, corpo, tipo):
+            self.send_response(codigo)
+            self.send_header('Content-Type', tipo)
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+def fetch_cube(url, atual=None, tentativas=3):
+    """Cliente do dashboard: {'versao', 'cubo'} publicado pelo agregador; reaproveita `atual` se a versão não mudou"""
+    for _ in range(tentativas):
+        with urlopen(f"{url}/status", timeout=10) as resposta:
+            status = json.load(resposta)
+        if status['bordas'] is None:
+            raise RuntimeError("agregador ainda carregando o cubo inicial")
+        if atual is not None and atual['versao'] == status['versao']:
+            return atual
+
+        try:
+            tabelas = {}
+            for nome in ('linhas', 'hist'):
+                with urlopen(f"{url}/cubo/{status['versao']}/{nome}.parquet", timeout=60) as resposta:
+                    tabelas[nome] = pd.read_parquet(io.BytesIO(resposta.read()))
+        except HTTPError as e:
+            # Nova versão publicada entre o status e o download: tenta de novo
+            if e.code == 409:
+                continue
+            raise
+
+        cubo = cube.assemble(tabelas['linhas'], tabelas['hist'], np.asarray(status['bordas']))
+        return {'versao': status['versao'], 'cubo': cubo}
+    raise RuntimeError("versão do cubo mudou durante o download")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Agregador do dashboard alimentado por LISTEN/NOTIFY")
+    # Sem autenticação: por padrão só aceita conexões locais (use 0.0.0.0 apenas em rede confiável)
+    parser.add_argument("--host", default="127.0.0.1", help="Endereço do servidor HTTP")
+    parser.add_argument("--porta", type=int, default=8765, help="Porta do servidor HTTP")
+    parser.add_argument("--debounce", type=float, default=0.5, help="Segundos sem eventos antes de aplicar o lote")
+    args = parser.parse_args()
+
+    estado = new_state()
+    servidor = ThreadingHTTPServer((args.host, args.porta), make_handler(estado))
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    print(f"📡 Agregador em http://{args.host}:{args.porta} (canal {CHANNEL})")
+    listen(get_engine(), estado, debounce=args.debounce)
@@ -0,0 +1,167 @@
+import os
+import gc
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+from datetime import datetime
+from sqlalchemy import text
+import main
+import queries
+import aggregations
+import cube
+import export
+from db import get_engine
+from enrichment import enrich, enrich_legacy
+from filter_index import build_filter_index, filter_positions
+from report_writers import EXCEL_MAX_ROWS
+from data_generator_chaos import generate_chaos, generate_chaos_sharded
+
+# Benchmark das etapas de extração, enriquecimento, filtros, agregações e exportação
+# Usa o Postgres local do docker-compose.yml e os geradores de dados sintéticos
+# python benchmark.py --tamanhos 10000 1000000 --workers 4
+# python benchmark.py --tamanhos 10000 --comparar bench_results/anterior.json
+
+RESULTS_DIR = 'bench_results'
+
+def measure(resultados, etapa, func, *args):
+    # Tempo de parede e pico de memória alocada pelo Python (tracemalloc) de uma etapa
+    gc.collect()
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    retorno = func(*args)
+    segundos = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    resultados.append({'etapa': etapa, 'segundos': round(segundos, 4), 'pico_mb': round(pico / 2**20, 2)})
+    print(f"   ⏱️ {etapa:<40} {segundos:>9.3f}s {pico / 2**20:>10.1f} MB")
+    return retorno
+
+def reset_generated(engine, base_id):
+    # Remove os dados sintéticos da faixa do benchmark (mantém o seed de 02_seed.sql)
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM items WHERE tax_document_id >= :base"), {'base': base_id})
+        conn.execute(text("DELETE FROM tasks WHERE process_instance_id >= :base"), {'base': base_id})
+        conn.execute(text("DELETE FROM tax_documents WHERE process_instance_id >= :base"), {'base': base_id})
+        conn.execute(text("DELETE FROM process_instances WHERE id >= :base"), {'base': base_id})
+
+def seed(tamanho, base_id, workers):
+    if workers > 1:
+        generate_chaos_sharded(tamanho, workers=workers, base_id=base_id)
+    else:
+        generate_chaos(tamanho, base_id=base_id, seed=42)
+
+def default_filters(df):
+    # Estado inicial do dashboard: período completo e todas as opções marcadas
+    return {
+        'periodo': (df['data_escrituracao'].min(), df['data_escrituracao'].max()),
+        'tipo_nota': df['tipo_nota'].dropna().unique().tolist(),
+        'nome_tarefa': df['nome_tarefa'].dropna().unique().tolist(),
+        'status_tarefa': df['status_tarefa'].dropna().unique().tolist(),
+        'estado_fornecedor': df['estado_fornecedor'].dropna().unique().tolist(),
+    }
+
+def run_size(engine):
+    resultados = []
+
+    # Relatório mensal (main.py)
+    with tempfile.TemporaryDirectory() as pasta:
+        diretorio_atual = os.getcwd()
+        os.chdir(pasta)
+        try:
+            df_relatorio = measure(resultados, 'main.extract_data', main.extract_data)
+            measure(resultados, 'main.save_report', main.save_report, df_relatorio)
+            measure(resultados, 'main.export_report (streaming xlsx)', main.export_report, 'xlsx')
+        finally:
+            os.chdir(diretorio_atual)
+
+    # Dataset do dashboard: JOIN + enriquecimento
+    bruto = measure(resultados, 'dashboard.join (read_sql)', queries.get_full_data, engine)
+    measure(resultados, 'dashboard.enrich (legado)', enrich_legacy, bruto.copy())
+    df = measure(resultados, 'dashboard.enrich', enrich, bruto.copy())
+    del bruto
+
+    # Filtros da barra lateral
+    filtros = default_filters(df)
+    df_filtered = measure(resultados, 'filtro.mascara_isin', aggregations.apply_filters, df, filtros)
+    indice = measure(resultados, 'filtro.build_filter_index', build_filter_index, df)
+    measure(resultados, 'filtro.bitmap', filter_positions, indice, filtros)
+
+    # Agregações de cada gráfico
+    measure(resultados, 'grafico.kpis', aggregations.kpis, df_filtered)
+    measure(resultados, 'grafico.pareto', aggregations.pareto, df_filtered)
+    measure(resultados, 'grafico.geo', aggregations.geo, df_filtered)
+    measure(resultados, 'grafico.histograma', aggregations.lead_time_histogram, df_filtered['lead_time_horas'])
+    measure(resultados, 'grafico.diario', aggregations.daily_series, df_filtered)
+    cubo = measure(resultados, 'cubo.build_cube', cube.build_cube, df)
+    measure(resultados, 'cubo.rollup', cube.rollup, cubo, filtros)
+
+    # Agregações no Postgres (modo sql)
+    measure(resultados, 'sql.fetch_aggregates', queries.fetch_aggregates, engine, filtros)
+
+    # Exportação do dashboard (acima do limite do Excel a etapa não é executada)
+    if len(df_filtered) < EXCEL_MAX_ROWS:
+        measure(resultados, 'export.to_excel', export.to_excel_bytes, df_filtered)
+    else:
+        resultados.append({'etapa': 'export.to_excel', 'segundos': None, 'pico_mb': None, 'pulado': 'acima do limite do Excel'})
+
+    # Exportação sob demanda (xlsxwriter constant_memory, abre novas abas acima do limite)
+    measure(resultados, 'export.xlsxwriter', export.export_bytes, df_filtered, 'xlsx')
+
+    return {'linhas_dataset': len(df), 'etapas': resultados}
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(atual, anterior, tolerancia):
+    # Aponta as etapas que ficaram mais lentas que o limite tolerado
+    regressoes = []
+    for tamanho, dados in atual['tamanhos'].items():
+        base = {e['etapa']: e for e in anterior.get('tamanhos', {}).get(tamanho, {}).get('etapas', [])}
+        for etapa in dados['etapas']:
+            antes = base.get(etapa['etapa'], {}).get('segundos')
+            agora = etapa['segundos']
+            if antes and agora and agora > antes * (1 + tolerancia):
+                regressoes.append((tamanho, etapa['etapa'], antes, agora))
+    return regressoes
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline em volumes crescentes")
+    parser.add_argument("--tamanhos", type=int, nargs='+', default=[10_000, 100_000], help="Quantidade de notas geradas por rodada")
+    parser.add_argument("--workers", type=int, default=1, help="Processos usados na geração dos dados")
+    parser.add_argument("--base-id", type=int, default=1_000_000, help="Primeiro ID da faixa de dados do benchmark")
+    parser.add_argument("--sem-seed", action="store_true", help="Não gera dados; mede o banco como está")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para detectar regressões")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Aumento de tempo tolerado na comparação (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    engine = get_engine()
+    saida = {'executado_em': datetime.now().isoformat(timespec='seconds'), 'commit': git_commit(), 'tamanhos': {}}
+
+    for tamanho in args.tamanhos:
+        print(f"\n📏 Tamanho: {tamanho} notas")
+        if not args.sem_seed:
+            reset_generated(engine, args.base_id)
+            seed(tamanho, args.base_id, args.workers)
+        saida['tamanhos'][str(tamanho)] = run_size(engine)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    arquivo = os.path.join(RESULTS_DIR, f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(arquivo, 'w', encoding='utf-8') as f:
+        json.dump(saida, f, indent=2, ensure_ascii=False)
+    print(f"\n💾 Resultados: {os.path.abspath(arquivo)}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            regressoes = compare(saida, json.load(f), args.tolerancia)
+        for tamanho, etapa, antes, agora in regressoes:
+            print(f"🐢 REGRESSÃO [{tamanho}] {etapa}: {antes:.3f}s -> {agora:.3f}s")
+        if regressoes:
+            raise SystemExit(1)
+        print("✅ Nenhuma regressão acima da tolerância.")
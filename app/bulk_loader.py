@@ -0,0 +1,46 @@
+import csv
+import io
+
+# Carga em massa via COPY FROM STDIN (psycopg2)
+# Cada lote é gravado em uma única transação; as tabelas seguem a ordem das FKs
+
+# Colunas de cada tabela na ordem em que as linhas são montadas pelos geradores
+TABLE_COLUMNS = {
+    'process_instances': ('id', 'type'),
+    'tax_documents': (
+        'id', 'number', 'type', 'total_value',
+        'supplier_identification_number', 'customer_identification_number',
+        'supplier_city_id', 'customer_city_id',
+        'supplier_state_id', 'customer_state_id',
+        'process_instance_id'
+    ),
+    'items': ('id', 'description', 'unit_price', 'total_value', 'purchase_order', 'tax_document_id'),
+    'tasks': ('id', 'created_at', 'completed_at', 'task_definition_id', 'status_id', 'process_instance_id'),
+}
+
+DEFAULT_BATCH_SIZE = 50_000
+
+def copy_rows(cursor, table, rows):
+    # Serializa as linhas em CSV na memória e envia em um único COPY
+    # Aceita lista de tuplas ou bloco colunar (DataFrame com as colunas de TABLE_COLUMNS)
+    buffer = io.StringIO()
+    if hasattr(rows, 'to_csv'):
+        rows.to_csv(buffer, header=False, index=False, columns=list(TABLE_COLUMNS[table]))
+    else:
+        csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+
+    columns = ', '.join(TABLE_COLUMNS[table])
+    cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+def copy_batch(conn, batch):
+    """Grava um lote {tabela: linhas ou bloco colunar} com COPY, em uma transação por lote"""
+    with conn.begin():
+        cursor = conn.connection.cursor()
+        try:
+            for table in TABLE_COLUMNS:
+                rows = batch.get(table)
+                if rows is not None and len(rows):
+                    copy_rows(cursor, table, rows)
+        finally:
+            cursor.close()
@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+from filter_index import FILTER_COLUMNS, build_filter_index, apply_index
+from enrichment import compact_dtypes
+from aggregations import top_cities, resample_series, time_grain
+
+# Cubo pré-agregado do dashboard, construído uma vez por carga de dados
+# Mudanças de filtro apenas consolidam (roll-up) as linhas do cubo: o custo depende do número de grupos
+
+CUBE_KEYS = [
+    'data_escrituracao', 'tipo_nota', 'nome_tarefa', 'status_tarefa',
+    'estado_fornecedor', 'cidade_fornecedor', 'cnpj_fornecedor', 'cnpj_formatado',
+]
+# O histograma só precisa das dimensões filtráveis + faixa de lead time
+HIST_KEYS = ['data_escrituracao'] + FILTER_COLUMNS
+CUBE_MEASURES = ['total_value', 'qtd', 'lead_soma', 'lead_qtd']
+
+def lead_time_edges(lead_times, nbins=20):
+    # Faixas fixas entre o menor e o maior lead time do dataset
+    valores = lead_times.dropna()
+    if valores.empty:
+        return np.linspace(0.0, 1.0, nbins + 1)
+    minimo, maximo = float(valores.min()), float(valores.max())
+    if maximo == minimo:
+        maximo = minimo + 1.0
+    return np.linspace(minimo, maximo, nbins + 1)
+
+def lead_time_bucket(lead_times, bordas):
+    # Índice da faixa de cada linha; valores fora das bordas caem na primeira/última faixa, nulos em -1
+    nbins = len(bordas) - 1
+    faixa = np.floor((lead_times - bordas[0]) / (bordas[1] - bordas[0])).clip(0, nbins - 1)
+    return faixa.fillna(-1).astype(int)
+
+def build_cube(df, nbins=20, bordas=None):
+    if bordas is None:
+        bordas = lead_time_edges(df['lead_time_horas'], nbins)
+    base = df.assign(
+        lead_qtd=df['lead_time_horas'].notna(),
+        faixa=lead_time_bucket(df['lead_time_horas'], bordas),
+    )
+
+    # dropna=False: linhas com dimensões nulas continuam contando nos totais
+    # sort=True: o cubo sai ordenado por data (NaT no fim), como o índice de filtros exige
+    linhas = base.groupby(CUBE_KEYS, observed=True, dropna=False, sort=True).agg(
+        total_value=('total_value', 'sum'),
+        qtd=('id', 'count'),
+        lead_soma=('lead_time_horas', 'sum'),
+        lead_qtd=('lead_qtd', 'sum'),
+    ).reset_index()
+
+    hist = (
+        base[base['faixa'] >= 0]
+        .groupby(HIST_KEYS + ['faixa'], observed=True, dropna=False, sort=True)
+        .size().reset_index(name='qtd')
+    )
+
+    return assemble(linhas, hist, bordas)
+
+def assemble(linhas, hist, bordas):
+    # Cubo a partir das tabelas já agregadas (ordenadas por data), com os índices de filtro
+    return {
+        'linhas': linhas, 'indice': build_filter_index(linhas),
+        'hist': hist, 'indice_hist': build_filter_index(hist),
+        'bordas': bordas,
+    }
+
+def _sum_groups(partes, chaves, medidas):
+    # category -> object para somar partes com categorias diferentes; grupos zerados saem do cubo
+    base = pd.concat(partes, ignore_index=True)
+    for coluna in chaves:
+        if isinstance(base[coluna].dtype, pd.CategoricalDtype):
+            base[coluna] = base[coluna].astype(object)
+    soma = base.groupby(chaves, dropna=False, sort=True)[medidas].sum().reset_index()
+    return compact_dtypes(soma[soma['qtd'] != 0].reset_index(drop=True))
+
+def apply_delta(cubo, novas, antigas):
+    """Soma as linhas novas e subtrai as antigas (mesmas colunas do dataset), mantendo as faixas do histograma"""
+    bordas = cubo['bordas']
+    linhas, hist = [cubo['linhas']], [cubo['hist']]
+    if len(novas):
+        mais = build_cube(novas, bordas=bordas)
+        linhas.append(mais['linhas'])
+        hist.append(mais['hist'])
+    if len(antigas):
+        menos = build_cube(antigas, bordas=bordas)
+        linhas.append(menos['linhas'].assign(**{m: -menos['linhas'][m] for m in CUBE_MEASURES}))
+        hist.append(menos['hist'].assign(qtd=-menos['hist']['qtd']))
+    if len(linhas) == 1:
+        return cubo
+    return assemble(
+        _sum_groups(linhas, CUBE_KEYS, CUBE_MEASURES), _sum_groups(hist, HIST_KEYS + ['faixa'], ['qtd']), bordas
+    )
+
+def rollup(cubo, filtros, top=10, top_cidades=10):
+    """Agregações dos gráficos a partir do cubo, no formato de aggregations.compute_aggregates"""
+    c = apply_index(cubo['linhas'], cubo['indice'], filtros)
+
+    lead_qtd = c['lead_qtd'].sum()
+    kpis = {
+        'total_gasto': c['total_value'].sum(),
+        'qtd_notas': c['qtd'].sum(),
+        'lead_time_medio': c['lead_soma'].sum() / lead_qtd if lead_qtd else np.nan,
+        # CNPJ é chave do cubo, então a contagem distinta é exata
+        'qtd_fornecedores': c['cnpj_fornecedor'].nunique(),
+    }
+
+    df_pareto = c.groupby('cnpj_formatado', observed=True)['total_value'].sum().nlargest(top).reset_index()
+    df_geo = top_cities(
+        c.groupby(['estado_fornecedor', 'cidade_fornecedor'], observed=True)['qtd'].sum().reset_index(name='volume_notas'),
+        top_cidades
+    )
+    df_time = resample_series(
+        c.groupby('data_escrituracao')['qtd'].sum().reset_index(name='qtd_notas'), time_grain(*filtros['periodo'])
+    )
+
+    bordas = cubo['bordas']
+    h = apply_index(cubo['hist'], cubo['indice_hist'], filtros)
+    contagem = h.groupby('faixa')['qtd'].sum().reindex(range(len(bordas) - 1), fill_value=0)
+    df_hist = pd.DataFrame({'inicio': bordas[:-1], 'fim': bordas[1:], 'contagem': contagem.to_numpy()})
+
+    return {'kpis': kpis, 'pareto': df_pareto, 'geo': df_geo, 'hist': df_hist, 'diario': df_time}
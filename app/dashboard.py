@@ -1,11 +1,24 @@
 import streamlit as st
-import pandas as pd
 import plotly.express as px
-from sqlalchemy import create_engine
 from dotenv import load_dotenv
 import os
-import io
+import threading
 from datetime import datetime
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import db
+import queries
+import data_store
+import export
+import export_cache
+import result_cache
+from enrichment import enrich
+import cube
+import aggregator
+import instrumentation
+from instrumentation import span
+from filter_index import apply_index
 
 # python -m streamlit run app/dashboard.py
 
@@ -13,68 +26,275 @@ from datetime import datetime
 st.set_page_config(page_title="Analytics de Escrituração", layout="wide")
 load_dotenv()
 
-def format_cnpj(value):
-    # Aplica a máscara de CNPJ
-    if pd.isna(value): return ""
-    v = str(value).zfill(14) 
-    return f"{v[:2]}.{v[2:5]}.{v[5:8]}/{v[8:12]}-{v[12:]}"
-
-# Função para converter o DataFrame em um arquivo Excel em memória
-@st.cache_data
-def to_excel(df):
-    output = io.BytesIO()
-    # Usando engine openpyxl para gerar o arquivo .xlsx
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Dados Filtrados')
-    processed_data = output.getvalue()
-    return processed_data
-
-@st.cache_data
-def get_data():
-    user = os.getenv("DB_USER")
-    password = os.getenv("DB_PASSWORD")
-    host = os.getenv("DB_HOST")
-    port = os.getenv("DB_PORT")
-    db_name = os.getenv("DB_NAME")
-    
-    engine = create_engine(f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{db_name}")
-    
-    query = """
-    SELECT
-        td.id,
-        td.total_value,
-        td.type AS tipo_nota,               
-        td_def.name AS nome_tarefa,         
-        st.name AS status_tarefa,           
-        td.supplier_identification_number AS cnpj_fornecedor,
-        c.name AS cidade_fornecedor,
-        s.name AS estado_fornecedor,
-        t.created_at,
-        t.completed_at
-    FROM tax_documents td
-    INNER JOIN tasks t ON td.process_instance_id = t.process_instance_id
-    LEFT JOIN cities c ON td.supplier_city_id = c.id
-    LEFT JOIN states s ON c.state_id = s.id
-    INNER JOIN task_definitions td_def ON t.task_definition_id = td_def.id
-    INNER JOIN status st ON t.status_id = st.id
-    ORDER BY t.completed_at;
-    """
-    
-    df = pd.read_sql(query, engine)
-    
-    # Engenharia de Atributos
-    df['lead_time_horas'] = (df['completed_at'] - df['created_at']).dt.total_seconds() / 3600
-    df['data_escrituracao'] = df['completed_at'].dt.date
-    
-    # Tratamento de CNPJ
-    df['cnpj_fornecedor'] = df['cnpj_fornecedor'].astype(str)
-    df['cnpj_formatado'] = df['cnpj_fornecedor'].apply(format_cnpj)
-    
-    return df
+# Backend de dados do painel:
+# - "pandas": carrega o dataset completo em memória e filtra/agrega no Python
+# - "sql": envia filtros e agregações (GROUP BY) para o Postgres e recebe só os resultados
+# - "aggregator": usa o cubo mantido ao vivo pelo agregador de eventos (aggregator.py)
+BACKEND = os.getenv("DASHBOARD_BACKEND", "pandas")
+
+# Fonte das agregações no modo sql: "base" (tabelas) ou "resumo" (mv_resumo_diario)
+SQL_SOURCE = os.getenv("DASHBOARD_SQL_SOURCE", "base")
+
+# Diretório do snapshot Parquet do dataset (vazio = carga inicial direto do banco)
+SNAPSHOT_DIR = os.getenv("DASHBOARD_SNAPSHOT_DIR", "")
+
+# Intervalo (segundos) entre atualizações incrementais do dataset / validade das agregações em cache
+REFRESH_SECONDS = int(os.getenv("DASHBOARD_REFRESH_SECONDS", "300"))
+
+# Endereço do agregador no modo aggregator
+AGGREGATOR_URL = os.getenv("DASHBOARD_AGGREGATOR_URL", "http://localhost:8765")
+
+# Consultas de agregação executadas em paralelo no modo sql (cada uma com uma conexão do pool)
+QUERY_WORKERS = int(os.getenv("DASHBOARD_QUERY_WORKERS", "5"))
+
+# Cache dos arquivos exportados (MB, compartilhado entre sessões) e threads de geração
+EXPORT_CACHE_MB = int(os.getenv("DASHBOARD_EXPORT_CACHE_MB", "256"))
+EXPORT_WORKERS = int(os.getenv("DASHBOARD_EXPORT_WORKERS", "2"))
+
+# Cache de resultados compartilhado entre processos/réplicas (arquivo SQLite, vazio = desativado) e tamanho (MB)
+RESULT_CACHE_PATH = os.getenv("DASHBOARD_RESULT_CACHE", "")
+RESULT_CACHE_MB = int(os.getenv("DASHBOARD_RESULT_CACHE_MB", "512"))
+
+# Código que monta a SQL e o formato das agregações: réplicas com outra versão não trocam resultados
+AGGREGATES_CODE_VERSION = result_cache.code_version('queries', 'aggregations', 'enrichment')
+
+# Painel de performance (oculto): DASHBOARD_PERF_PANEL=1 ou ?perf=1 na URL
+PERF_PANEL = os.getenv("DASHBOARD_PERF_PANEL", "0") == "1"
+
+# Arquivo JSON Lines com as métricas de cada rerun (vazio = sem exportação)
+instrumentation.configure_log(os.getenv("DASHBOARD_PERF_LOG", ""))
+instrumentation.start_run()
+
+@st.cache_resource
+def get_engine():
+    # Engine com pool compartilhado por todas as sessões do processo
+    return db.get_engine()
+
+@st.cache_resource
+def get_export_cache():
+    # Arquivos gerados sob demanda, por (versão dos dados, formato, filtros)
+    return export_cache.new_cache(EXPORT_CACHE_MB * 2**20, EXPORT_WORKERS)
+
+@st.cache_resource
+def get_result_cache():
+    # Resultados do JOIN completo e das agregações, reaproveitados por todos os processos da máquina
+    if not RESULT_CACHE_PATH:
+        return None
+    return result_cache.new_cache(RESULT_CACHE_PATH, RESULT_CACHE_MB * 2**20)
+
+@st.cache_resource
+def get_data_store():
+    # Compartilhado entre sessões: dataset, watermark e versão dos dados
+    return data_store.new_store(SNAPSHOT_DIR or None, get_result_cache())
+
+def get_data(force=False):
+    # Carga completa na primeira vez e no botão "Atualizar dados"; depois apenas as tarefas novas desde o watermark
+    return data_store.get_data(get_engine(), get_data_store(), REFRESH_SECONDS, force=force)
+
+@st.cache_resource
+def get_live_cube():
+    # Último cubo baixado do agregador, compartilhado entre sessões
+    return {'atual': None}
+
+def get_cube():
+    # Consulta só a versão publicada; o cubo é baixado de novo apenas quando ela muda
+    holder = get_live_cube()
+    holder['atual'] = aggregator.fetch_cube(AGGREGATOR_URL, holder['atual'])
+    return holder['atual']
+
+@st.cache_data(ttl=REFRESH_SECONDS)
+def get_filter_options():
+    return queries.get_filter_options(get_engine())
+
+@st.cache_resource
+def get_executor():
+    # Threads compartilhadas pelas sessões; limita as consultas simultâneas do processo no pool
+    return ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix="agregacoes")
+
+@st.cache_data(ttl=REFRESH_SECONDS, show_spinner=False)
+def get_aggregate_cached(nome, filtros):
+    instrumentation.count('get_aggregates.misses')
+    funcao, kwargs = queries.aggregate_calls(SQL_SOURCE)[nome]
+    compartilhado = get_result_cache()
+    if compartilhado is None:
+        return funcao(get_engine(), filtros, **kwargs)
+    # A consulta de cada agregação é determinada pela função, pelos kwargs, pelos filtros e pelo código
+    return result_cache.get_or_compute(
+        compartilhado, 'agregacoes', f"{funcao.__module__}.{funcao.__name__}",
+        {'filtros': filtros, 'codigo': AGGREGATES_CODE_VERSION, **kwargs},
+        get_data_version(), lambda: funcao(get_engine(), filtros, **kwargs)
+    )
+
+def get_aggregate(nome, filtros):
+    # Chamado nas threads do executor, uma agregação por vez
+    instrumentation.count('get_aggregates.chamadas')
+    return get_aggregate_cached(nome, filtros)
+
+def with_script_ctx(funcao, ctx):
+    # As threads do executor não herdam o ScriptRunContext da sessão (não é um contextvar);
+    # sem ele, st.cache_data roda fora da sessão e avisa "missing ScriptRunContext" a cada miss
+    # As threads são reaproveitadas entre sessões, então o contexto é anexado a cada tarefa
+    def executar():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return funcao()
+    return executar
+
+@st.cache_data(ttl=REFRESH_SECONDS)
+def get_data_version():
+    return queries.get_data_version(get_engine())
+
+def get_filtered_rows(engine, filtros):
+    return enrich(queries.get_rows(engine, filtros))
+
+@st.fragment(run_every=1)
+def export_progress(chave):
+    # Atualiza só a barra de progresso; ao terminar, reexecuta a página para mostrar o download
+    estado, valor = export_cache.status(get_export_cache(), chave)
+    if estado == 'gerando':
+        st.progress(valor, text=f"Gerando arquivo... {valor:.0%}")
+    else:
+        st.rerun()
+
+def render_export(chave, gerar):
+    # Nada é gerado até o usuário pedir; arquivos já prontos vêm direto do cache
+    cache = get_export_cache()
+    formato = chave[1]
+    estado, valor = export_cache.status(cache, chave)
+
+    if estado == 'pronto':
+        instrumentation.count('exportacao.chamadas')
+        _, extensao, mime = export.EXPORT_FORMATS[formato]
+        # Gera um nome de arquivo dinâmico com a data/hora atual
+        nome_arquivo = f"relatorio_fiscal_{datetime.now().strftime('%Y%m%d_%H%M')}.{extensao}"
+        st.download_button(label=f"Baixar Arquivo ({formato})", data=valor, file_name=nome_arquivo, mime=mime)
+    elif estado == 'gerando':
+        export_progress(chave)
+    else:
+        if estado == 'erro':
+            st.error(f"Falha na exportação: {valor}")
+        if st.button("Preparar Arquivo"):
+            instrumentation.count('exportacao.chamadas')
+            export_cache.request(cache, chave, gerar)
+            st.rerun()
+
+def render_perf_panel(registro):
+    # Tempos do rerun atual, consultas SQL executadas e acertos de cache acumulados no processo
+    with st.expander(f"⏱️ Performance ({registro['total_ms']:.0f} ms neste rerun)"):
+        st.caption("Etapas")
+        st.dataframe(registro['spans'], use_container_width=True)
+        st.caption("Consultas SQL (linhas e memória do DataFrame retornado, incluindo as strings)")
+        st.dataframe(registro['sql'], use_container_width=True)
+        st.caption("Caches")
+        st.dataframe(
+            [{'cache': nome, **instrumentation.cache_stats(nome)} for nome in ('get_data', 'get_aggregates', 'exportacao', 'resultados')],
+            use_container_width=True
+        )
+        compartilhado = get_result_cache()
+        if compartilhado is not None:
+            resumo = result_cache.stats(compartilhado)
+            st.caption(f"Cache compartilhado (todos os processos): {resumo['itens']} resultados, {resumo['bytes'] / 2**20:.1f} MB")
+            st.dataframe(resumo['por_nome'], use_container_width=True)
+
+# SEÇÕES DOS GRÁFICOS (cada uma desenha no próprio container a partir dos agregados)
+def render_kpis(secao, agregados):
+    kpis = agregados['kpis']
+    with secao:
+        # LINHA 1: KPIs
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Spend", f"R$ {kpis['total_gasto']:,.2f}")
+        col2.metric("Notas", int(kpis['qtd_notas']))
+        col3.metric("Lead Time Médio", f"{kpis['lead_time_medio']:.1f} h")
+        col4.metric("Fornecedores", int(kpis['qtd_fornecedores']))
+        st.markdown("---")
+
+def render_pareto(secao, agregados):
+    with secao:
+        st.subheader("A. Spend por Fornecedor (Pareto)")
+        fig_pareto = px.bar(
+            agregados['pareto'], x='total_value', y='cnpj_formatado', orientation='h',
+            title="Top 10 Fornecedores (No Filtro Atual)",
+            color='total_value', color_continuous_scale='Bluyl'
+        )
+        fig_pareto.update_layout(yaxis={'categoryorder':'total ascending'})
+        st.plotly_chart(fig_pareto, use_container_width=True)
+
+def render_geo(secao, agregados):
+    with secao:
+        st.subheader("B. Origem (Estado / Cidade)")
+        # Top 10 cidades por estado; as demais aparecem somadas em "Outras"
+        # category sem ordem (modos pandas/agregador) quebra o max() que o plotly calcula na coluna de cor
+        df_geo = agregados['geo'].astype({'estado_fornecedor': object, 'cidade_fornecedor': object})
+        fig_geo = px.sunburst(
+            df_geo, path=['estado_fornecedor', 'cidade_fornecedor'], values='volume_notas',
+            title="Distribuição Geográfica",
+            color='estado_fornecedor', color_discrete_sequence=px.colors.qualitative.Pastel
+        )
+        fig_geo.update_traces(textinfo="label+percent entry")
+        st.plotly_chart(fig_geo, use_container_width=True)
+
+def render_hist(secao, agregados):
+    with secao:
+        st.subheader("C. Lead Time")
+        # Histograma já chega em bins (inicio, fim, contagem)
+        df_hist = agregados['hist'].assign(lead_time_horas=lambda h: (h['inicio'] + h['fim']) / 2)
+        fig_hist = px.bar(
+            df_hist, x="lead_time_horas", y="contagem",
+            title="Histograma de Tempo de Processamento", color_discrete_sequence=['#00CC96']
+        )
+        fig_hist.update_layout(bargap=0)
+        fig_hist.add_vline(x=agregados['kpis']['lead_time_medio'], line_dash="dash", annotation_text="Média")
+        st.plotly_chart(fig_hist, use_container_width=True)
+
+# Rótulo da série conforme a granularidade escolhida pelo tamanho do período
+GRAIN_LABELS = {'dia': 'Dia', 'semana': 'Semana', 'mes': 'Mês'}
+
+def render_diario(secao, agregados):
+    df_time = agregados['diario']
+    rotulo = GRAIN_LABELS[df_time['granularidade'].iat[0]] if len(df_time) else 'Dia'
+    with secao:
+        st.subheader("D. Evolução Temporal")
+        fig_line = px.area(
+            df_time, x='data_escrituracao', y='qtd_notas',
+            title=f"Volume de Notas por {rotulo}", markers=True,
+            labels={'data_escrituracao': rotulo, 'qtd_notas': 'Notas'}
+        )
+        st.plotly_chart(fig_line, use_container_width=True)
+
+RENDERERS = {
+    'kpis': render_kpis, 'pareto': render_pareto, 'geo': render_geo, 'hist': render_hist, 'diario': render_diario,
+}
 
 # INTERFACE
 try:
-    df = get_data()
+    if BACKEND == "sql":
+        with span('dados.filter_options'):
+            opcoes = get_filter_options()
+    elif BACKEND == "aggregator":
+        with span('dados.agregador'):
+            ao_vivo = get_cube()
+        linhas = ao_vivo['cubo']['linhas']
+        st.sidebar.caption(f"Cubo ao vivo: versão {ao_vivo['versao']}")
+        opcoes = {
+            'periodo': (linhas['data_escrituracao'].min(), linhas['data_escrituracao'].max()),
+            'tipo_nota': linhas['tipo_nota'].unique().tolist(),
+            'nome_tarefa': linhas['nome_tarefa'].unique().tolist(),
+            'status_tarefa': linhas['status_tarefa'].unique().tolist(),
+            'estado_fornecedor': linhas['estado_fornecedor'].dropna().unique().tolist(),
+        }
+    else:
+        forcar = st.sidebar.button("🔄 Atualizar dados")
+        with span('dados.get_data'):
+            dados = get_data(force=forcar)
+        df = dados['df']
+        atualizado_em = datetime.fromtimestamp(get_data_store()['atualizado_em'])
+        st.sidebar.caption(f"Dados atualizados às {atualizado_em.strftime('%H:%M:%S')}")
+        opcoes = {
+            'periodo': (df['data_escrituracao'].min(), df['data_escrituracao'].max()),
+            'tipo_nota': df['tipo_nota'].unique().tolist(),
+            'nome_tarefa': df['nome_tarefa'].unique().tolist(),
+            'status_tarefa': df['status_tarefa'].unique().tolist(),
+            'estado_fornecedor': df['estado_fornecedor'].dropna().unique().tolist(),
+        }
     
     # Título
     st.title("Monitoramento de Performance Fiscal")
@@ -85,124 +305,107 @@ try:
     st.sidebar.header("Filtros de Análise")
     
     # 1. Filtro de Data
-    min_date = df['data_escrituracao'].min()
-    max_date = df['data_escrituracao'].max()
+    min_date, max_date = opcoes['periodo']
     date_range = st.sidebar.date_input("Período", [min_date, max_date])
+    if len(date_range) == 1:
+        # Enquanto o usuário escolhe o fim do intervalo
+        date_range = (date_range[0], date_range[0])
 
     # 2. Filtros de Negócio (Multiselect)
-    tipos_disponiveis = df['tipo_nota'].unique()
+    tipos_disponiveis = opcoes['tipo_nota']
     filtro_tipo = st.sidebar.multiselect("Tipo de Nota", options=tipos_disponiveis, default=tipos_disponiveis)
     
-    tarefas_disponiveis = df['nome_tarefa'].unique()
+    tarefas_disponiveis = opcoes['nome_tarefa']
     filtro_tarefa = st.sidebar.multiselect("Tarefa Analisada", options=tarefas_disponiveis, default=tarefas_disponiveis)
     
-    status_disponiveis = df['status_tarefa'].unique()
+    status_disponiveis = opcoes['status_tarefa']
     filtro_status = st.sidebar.multiselect("Status do Processo", options=status_disponiveis, default=status_disponiveis)
 
-    estados_disponiveis = df['estado_fornecedor'].dropna().unique()
+    estados_disponiveis = opcoes['estado_fornecedor']
     filtro_estado = st.sidebar.multiselect("Estado do Fornecedor", options=estados_disponiveis, default=estados_disponiveis)
     
-    # APLICAÇÃO DOS FILTROS (PANDAS)
-    mask = (
-        (df['data_escrituracao'] >= date_range[0]) & 
-        (df['data_escrituracao'] <= date_range[1]) &
-        (df['tipo_nota'].isin(filtro_tipo)) &
-        (df['nome_tarefa'].isin(filtro_tarefa)) &
-        (df['status_tarefa'].isin(filtro_status)) &
-        (df['estado_fornecedor'].isin(filtro_estado))
-    )
+    filtros = {
+        'periodo': (date_range[0], date_range[1]),
+        'tipo_nota': filtro_tipo,
+        'nome_tarefa': filtro_tarefa,
+        'status_tarefa': filtro_status,
+        'estado_fornecedor': filtro_estado,
+    }
     
-    df_filtered = df.loc[mask]
+    # APLICAÇÃO DOS FILTROS E AGREGAÇÕES
+    if BACKEND == "sql":
+        # Uma consulta por gráfico, todas disparadas juntas; os resultados chegam na ordem em que terminam
+        ctx = get_script_run_ctx()
+        resultados = queries.iter_parallel(
+            {
+                nome: with_script_ctx(partial(get_aggregate, nome, filtros), ctx)
+                for nome in queries.aggregate_calls(SQL_SOURCE)
+            },
+            get_executor()
+        )
+    elif BACKEND == "aggregator":
+        # Mesmo roll-up do modo pandas, sobre o cubo recebido do agregador
+        with span('agregacoes.groupby_cubo'):
+            resultados = cube.rollup(ao_vivo['cubo'], filtros).items()
+    else:
+        # Bitmaps pré-calculados + recorte binário do período (ver filter_index.py)
+        with span('filtros.mascara'):
+            df_filtered = apply_index(df, dados['indice'], filtros)
+        # Gráficos consolidados a partir do cubo pré-agregado (ver cube.py)
+        with span('agregacoes.groupby_cubo'):
+            resultados = cube.rollup(dados['cubo'], filtros).items()
+
+    # GRÁFICOS: espaços reservados na ordem da página, preenchidos conforme cada agregação fica pronta
+    aviso = st.empty()
+    secoes = {'kpis': st.container()}
+    # LINHA 2: Spend por Forcenedor e Distribuição Geográfica / LINHA 3: Operacional e Temporal
+    secoes['pareto'], secoes['geo'] = st.columns(2)
+    secoes['hist'], secoes['diario'] = st.columns(2)
+
+    agregados, desenhados = {}, set()
+    with span('agregacoes.graficos'):
+        for nome, resultado in resultados:
+            agregados[nome] = resultado
+            # Os gráficos esperam os KPIs (filtro vazio e lead time médio usado no histograma)
+            if 'kpis' not in agregados or agregados['kpis']['qtd_notas'] == 0:
+                continue
+            for pronto in [n for n in agregados if n not in desenhados]:
+                with span(f'plotly.{pronto}'):
+                    RENDERERS[pronto](secoes[pronto], agregados)
+                desenhados.add(pronto)
+
+    tem_dados = agregados['kpis']['qtd_notas'] > 0
+
+    # VERIFICAÇÃO DE DADOS VAZIOS PARA OS GRÁFICOS
+    if not tem_dados:
+        aviso.warning("Nenhum dado encontrado com os filtros selecionados")
 
     # BOTÃO DE EXPORTAÇÃO
     st.sidebar.markdown("---")
     st.sidebar.subheader("📥 Exportação")
     
-    if not df_filtered.empty:
-        # Gera o arquivo Excel em memória
-        excel_data = to_excel(df_filtered)
-        
-        # Gera um nome de arquivo dinâmico com a data/hora atual
-        nome_arquivo = f"relatorio_fiscal_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx"
-        
-        st.sidebar.download_button(
-            label="Baixar Planilha (Excel)",
-            data=excel_data,
-            file_name=nome_arquivo,
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
-    else:
-        st.sidebar.warning("Sem dados para exportar")
+    if tem_dados:
+        formato = st.sidebar.selectbox("Formato", list(export.EXPORT_FORMATS))
 
-    # VERIFICAÇÃO DE DADOS VAZIOS PARA OS GRÁFICOS
-    if df_filtered.empty:
-        st.warning("Nenhum dado encontrado com os filtros selecionados")
-    else:
-        # LINHA 1: KPIs
-        col1, col2, col3, col4 = st.columns(4)
-        
-        total_gasto = df_filtered['total_value'].sum()
-        qtd_notas = df_filtered['id'].count()
-        lead_time_medio = df_filtered['lead_time_horas'].mean()
-        qtd_fornecedores = df_filtered['cnpj_fornecedor'].nunique()
-        
-        col1.metric("Spend", f"R$ {total_gasto:,.2f}")
-        col2.metric("Notas", qtd_notas)
-        col3.metric("Lead Time Médio", f"{lead_time_medio:.1f} h")
-        col4.metric("Fornecedores", qtd_fornecedores)
-        
-        st.markdown("---")
+        # Geração em segundo plano: nos modos SQL/agregador as linhas só são buscadas dentro da tarefa
+        if BACKEND in ("sql", "aggregator"):
+            versao = f"agregador-{ao_vivo['versao']}" if BACKEND == "aggregator" else get_data_version()
+            engine = get_engine()
+            gerar = lambda progresso: export.export_bytes(get_filtered_rows(engine, filtros), formato, progresso)
+        else:
+            versao = dados['versao']
+            gerar = lambda progresso: export.export_bytes(df_filtered, formato, progresso)
 
-        # LINHA 2: Spend por Forcenedor e Distribuição Geográfica
-        c1, c2 = st.columns(2)
-        
-        with c1:
-            st.subheader("A. Spend por Fornecedor (Pareto)")
-            df_pareto = df_filtered.groupby('cnpj_formatado')['total_value'].sum().reset_index()
-            df_pareto = df_pareto.sort_values(by='total_value', ascending=False).head(10)
-            
-            fig_pareto = px.bar(
-                df_pareto, x='total_value', y='cnpj_formatado', orientation='h',
-                title="Top 10 Fornecedores (No Filtro Atual)",
-                color='total_value', color_continuous_scale='Bluyl'
-            )
-            fig_pareto.update_layout(yaxis={'categoryorder':'total ascending'})
-            st.plotly_chart(fig_pareto, use_container_width=True)
-
-        with c2:
-            st.subheader("B. Origem (Estado / Cidade)")
-            df_geo = df_filtered.groupby(['estado_fornecedor', 'cidade_fornecedor']).size().reset_index(name='volume_notas')
-            
-            fig_geo = px.sunburst(
-                df_geo, path=['estado_fornecedor', 'cidade_fornecedor'], values='volume_notas',
-                title="Distribuição Geográfica",
-                color='estado_fornecedor', color_discrete_sequence=px.colors.qualitative.Pastel
-            )
-            fig_geo.update_traces(textinfo="label+percent entry")
-            st.plotly_chart(fig_geo, use_container_width=True)
-
-        # LINHA 3: OPERACIONAL E TEMPORAL
-        c3, c4 = st.columns(2)
-        
-        with c3:
-            st.subheader("C. Lead Time")
-            fig_hist = px.histogram(
-                df_filtered, x="lead_time_horas", nbins=20,
-                title="Histograma de Tempo de Processamento", color_discrete_sequence=['#00CC96']
-            )
-            fig_hist.add_vline(x=lead_time_medio, line_dash="dash", annotation_text="Média")
-            st.plotly_chart(fig_hist, use_container_width=True)
-
-        with c4:
-            st.subheader("D. Evolução Diária")
-            df_time = df_filtered.groupby('data_escrituracao')['id'].count().reset_index()
-            
-            fig_line = px.area(
-                df_time, x='data_escrituracao', y='id',
-                title="Volume de Notas por Dia", markers=True
-            )
-            st.plotly_chart(fig_line, use_container_width=True)
+        with st.sidebar:
+            render_export(export_cache.cache_key(versao, formato, filtros), gerar)
+    else:
+        st.sidebar.warning("Sem dados para exportar")
 
 except Exception as e:
     st.error(f"Erro no sistema: {e}")
-    st.info("Verifique a conexão com o banco de dados")
\ No newline at end of file
+    st.info("Verifique a conexão com o banco de dados")
+
+# MÉTRICAS DO RERUN (gravadas no log mesmo com o painel oculto)
+registro = instrumentation.finish_run()
+if PERF_PANEL or st.query_params.get("perf") == "1":
+    render_perf_panel(registro)
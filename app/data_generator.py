@@ -1,23 +1,22 @@
 import os
-import random
+import time
+import argparse
+import multiprocessing
 from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
 from faker import Faker
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from dotenv import load_dotenv
+from db import get_engine
+from partitions import ensure_partitions
+from bulk_loader import DEFAULT_BATCH_SIZE, copy_batch
+from queries import refresh_reporting_views
 
 # Configurações Iniciais
 load_dotenv()
 fake = Faker('pt_BR') 
 
-# Conexão com o Banco
-def get_engine():
-    user = os.getenv("DB_USER")
-    password = os.getenv("DB_PASSWORD")
-    host = os.getenv("DB_HOST")
-    port = os.getenv("DB_PORT")
-    db_name = os.getenv("DB_NAME")
-    return create_engine(f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{db_name}")
-
 def setup_extra_cities(conn):
     """Insere cidades extras para análise geográfica (Pilar B)"""
     cidades_extras = [
@@ -37,115 +36,185 @@ def setup_extra_cities(conn):
         """))
     conn.commit()
 
-def generate_data(n_records=50):
+# Cidades (Pilar B - Geográfico) e os IDs pertencentes a MG (state_id 1)
+city_ids = [1, 2, 3, 10, 11, 12, 13, 14]
+cidades_mg = [1, 2, 10, 11]
+
+descricoes_itens = ['Cimento', 'Aço', 'Cabo', 'Disjuntor', 'Notebook', 'Monitor']
+
+def build_data_block(rng, base_id, n, fornecedores_carteira, pesos_fornecedores, first_day_last_month, delta_days):
+    # Sorteia o lote inteiro de uma vez (colunas NumPy) e devolve um bloco colunar por tabela
+    ids = np.arange(base_id, base_id + n, dtype=np.int64)
+    
+    cidades = np.asarray(city_ids)
+    supplier_city = cidades[rng.integers(0, len(cidades), n)]
+    customer_city = cidades[rng.integers(0, len(cidades), n)]
+    
+    # Escolha ponderada do fornecedor (Aplica a lógica 80/20)
+    pesos = np.asarray(pesos_fornecedores) / np.sum(pesos_fornecedores)
+    cnpj_fornecedor = np.asarray(fornecedores_carteira)[rng.choice(len(fornecedores_carteira), size=n, p=pesos)]
+    
+    valor_nota = np.round(rng.uniform(500.00, 15000.00, n), 2)
+    
+    # Itens (Para validação do STRING_AGG da Query Original): 1 a 3 por nota
+    qtd_itens = rng.integers(1, 4, n)
+    nota_do_item = np.repeat(np.arange(n), qtd_itens)
+    seq_item = np.arange(len(nota_do_item)) - np.repeat(np.cumsum(qtd_itens) - qtd_itens, qtd_itens)
+    preco_item = np.round(valor_nota[nota_do_item] / qtd_itens[nota_do_item], 2)
+    pedidos = pd.Series(rng.integers(100, 1000, len(nota_do_item))).astype(str)
+    
+    # Tarefas (Pilar C - Eficiência/Lead Time): dia do mês passado e lead time de 2h a 72h
+    date_completed = np.datetime64(first_day_last_month) + rng.integers(0, delta_days + 1, n).astype('timedelta64[D]')
+    date_created = date_completed - rng.integers(2, 73, n).astype('timedelta64[h]')
+    
+    return {
+        'process_instances': pd.DataFrame({'id': ids, 'type': 'Inbound'}),
+        'tax_documents': pd.DataFrame({
+            'id': ids, 'number': rng.integers(10000, 100000, n), 'type': 'MaterialInvoice', 'total_value': valor_nota,
+            'supplier_identification_number': cnpj_fornecedor, 'customer_identification_number': '99999999000199',
+            'supplier_city_id': supplier_city, 'customer_city_id': customer_city,
+            'supplier_state_id': np.where(np.isin(supplier_city, cidades_mg), 1, 2),
+            'customer_state_id': np.where(np.isin(customer_city, cidades_mg), 1, 2),
+            'process_instance_id': ids
+        }),
+        'items': pd.DataFrame({
+            'id': ids[nota_do_item] * 10 + seq_item,
+            'description': np.asarray(descricoes_itens)[rng.integers(0, len(descricoes_itens), len(nota_do_item))],
+            'unit_price': preco_item, 'total_value': preco_item,
+            'purchase_order': 'PO-2026-' + pedidos,
+            'tax_document_id': ids[nota_do_item]
+        }),
+        'tasks': pd.DataFrame({
+            'id': ids, 'created_at': date_created, 'completed_at': date_completed,
+            'task_definition_id': 12, 'status_id': 120, 'process_instance_id': ids
+        }),
+    }
+
+def build_suppliers(seed=None):
+    # --- AJUSTE PARA O PILAR DE GASTOS & FORNECEDORES ---
+    # Criamos uma lista fixa de 8 fornecedores para garantir recorrência
+    # Alguns CNPJs (fictícios gerados) para dar credibilidade; com seed, todos os shards compartilham os mesmos
+    if seed is not None:
+        fake.seed_instance(seed)
+    return [fake.cnpj().replace('.', '').replace('/', '').replace('-', '') for _ in range(8)]
+
+# Pesos: Os primeiros fornecedores da lista terão mais chances de serem escolhidos (Simulando Pareto)
+pesos_fornecedores = [0.30, 0.20, 0.15, 0.10, 0.10, 0.05, 0.05, 0.05]
+
+def last_month_range(today):
+    # Datas para análise de Volumetria Temporal
+    first_day_this_month = today.replace(day=1)
+    last_day_last_month = first_day_this_month - timedelta(days=1)
+    first_day_last_month = last_day_last_month.replace(day=1)
+    return first_day_last_month, last_day_last_month
+
+def generate_data(n_records=50, batch_size=DEFAULT_BATCH_SIZE, base_id=2000, seed=None,
+                  fornecedores=None, today=None, setup=True, refresh_views=True):
     engine = get_engine()
+    # Semente própria por shard: execuções com a mesma seed geram os mesmos dados
+    rng = np.random.default_rng(seed)
+    total_linhas = 0
     
     with engine.connect() as conn:
-        setup_extra_cities(conn)
-        
-        print(f"🚀 Gerando {n_records} notas fiscais com lógica de Pareto...")
+        if setup:
+            setup_extra_cities(conn)
         
-        # --- AJUSTE PARA O PILAR DE GASTOS & FORNECEDORES ---
-        # Criamos uma lista fixa de 8 fornecedores para garantir recorrência
-        # Alguns CNPJs (fictícios gerados) para dar credibilidade
-        fornecedores_carteira = [fake.cnpj().replace('.', '').replace('/', '').replace('-', '') for _ in range(8)]
+        print(f"🚀 Gerando {n_records} notas fiscais com lógica de Pareto (lotes de {batch_size})...")
         
-        # Pesos: Os primeiros fornecedores da lista terão mais chances de serem escolhidos (Simulando Pareto)
-        pesos_fornecedores = [0.30, 0.20, 0.15, 0.10, 0.10, 0.05, 0.05, 0.05]
-        # -----------------------------------------------------
+        if fornecedores is None:
+            fornecedores = build_suppliers(seed)
+        first_day_last_month, last_day_last_month = last_month_range(today or datetime.now())
+        delta_days = (last_day_last_month - first_day_last_month).days
 
-        # Datas para análise de Volumetria Temporal
-        today = datetime.now()
-        first_day_this_month = today.replace(day=1)
-        last_day_last_month = first_day_this_month - timedelta(days=1)
-        first_day_last_month = last_day_last_month.replace(day=1)
+        if setup:
+            # Layout particionado (opcional): partição do mês gerado antes da carga, em vez da DEFAULT
+            ensure_partitions(engine, first_day_last_month, last_day_last_month)
         
-        base_id = 2000 
-        
-        for i in range(n_records):
-            current_id = base_id + i
-            
-            # 1. Instância de Processo
-            conn.execute(text(f"INSERT INTO process_instances (id, type) VALUES ({current_id}, 'Inbound')"))
-            
-            # 2. Cidades (Pilar B - Geográfico)
-            city_ids = [1, 2, 3, 10, 11, 12, 13, 14]
-            supplier_city = random.choice(city_ids)
-            customer_city = random.choice(city_ids)
-            supplier_state = 1 if supplier_city in [1, 2, 10, 11] else 2
-            customer_state = 1 if customer_city in [1, 2, 10, 11] else 2
-
-            # 3. Nota Fiscal 
-            # Escolha ponderada do fornecedor (Aplica a lógica 80/20)
-            cnpj_fornecedor = random.choices(fornecedores_carteira, weights=pesos_fornecedores, k=1)[0]
-            
-            valor_nota = round(random.uniform(500.00, 15000.00), 2)
+        for inicio in range(0, n_records, batch_size):
+            lote = build_data_block(
+                rng, base_id + inicio, min(batch_size, n_records - inicio),
+                fornecedores, pesos_fornecedores, first_day_last_month, delta_days
+            )
             
-            sql_nota = text("""
-                INSERT INTO tax_documents (
-                    id, number, type, total_value, 
-                    supplier_identification_number, customer_identification_number, 
-                    supplier_city_id, customer_city_id, 
-                    supplier_state_id, customer_state_id,
-                    process_instance_id
-                ) VALUES (
-                    :id, :number, 'MaterialInvoice', :val, 
-                    :cnpj_f, '99999999000199', 
-                    :city_f, :city_c, 
-                    :state_f, :state_c,
-                    :proc_id
-                )
-            """)
-            
-            conn.execute(sql_nota, {
-                "id": current_id,
-                "number": random.randint(10000, 99999),
-                "val": valor_nota,
-                "cnpj_f": cnpj_fornecedor,
-                "city_f": supplier_city,
-                "city_c": customer_city,
-                "state_f": supplier_state,
-                "state_c": customer_state,
-                "proc_id": current_id
-            })
-            
-            # 4. Itens (Para validação do STRING_AGG da Query Original)
-            qtd_itens = random.randint(1, 3)
-            for k in range(qtd_itens):
-                item_id = (current_id * 10) + k
-                conn.execute(text("""
-                    INSERT INTO items (id, description, unit_price, total_value, purchase_order, tax_document_id)
-                    VALUES (:id, :desc, :price, :total, :po, :doc_id)
-                """), {
-                    "id": item_id,
-                    "desc": random.choice(['Cimento', 'Aço', 'Cabo', 'Disjuntor', 'Notebook', 'Monitor']),
-                    "price": round(valor_nota / qtd_itens, 2),
-                    "total": round(valor_nota / qtd_itens, 2),
-                    "po": f"PO-2026-{random.randint(100, 999)}",
-                    "doc_id": current_id
-                })
-            
-            # 5. Tarefas (Pilar C - Eficiência/Lead Time)
-            delta_days = (last_day_last_month - first_day_last_month).days
-            random_day = random.randint(0, delta_days)
-            date_completed = first_day_last_month + timedelta(days=random_day)
-            
-            # Variação de Lead Time (2h a 72h) para gerar histograma rico
-            hours_diff = random.randint(2, 72) 
-            date_created = date_completed - timedelta(hours=hours_diff)
-            
-            conn.execute(text("""
-                INSERT INTO tasks (id, created_at, completed_at, task_definition_id, status_id, process_instance_id)
-                VALUES (:id, :created, :completed, 12, 120, :proc_id)
-            """), {
-                "id": current_id,
-                "created": date_created,
-                "completed": date_completed,
-                "proc_id": current_id
-            })
+            # Um COPY por tabela e uma transação por lote
+            copy_batch(conn, lote)
+            total_linhas += sum(len(linhas) for linhas in lote.values())
+            print(f"   📦 {min(inicio + batch_size, n_records)}/{n_records} notas gravadas")
         
-        conn.commit()
         print("✅ Sucesso! Dados gerados com padrão de análise sênior.")
+    
+    if refresh_views and refresh_reporting_views(engine):
+        print("📊 Resumo diário (mv_resumo_diario) atualizado.")
+    
+    return total_linhas
+
+def _run_shard(shard):
+    # Executado em um processo próprio, com conexão e seed próprias
+    inicio = time.perf_counter()
+    linhas = generate_data(
+        shard['n_records'], batch_size=shard['batch_size'], base_id=shard['base_id'],
+        seed=shard['seed'], fornecedores=shard['fornecedores'], today=shard['today'],
+        setup=False, refresh_views=False
+    )
+    return shard['shard'], linhas, time.perf_counter() - inicio
+
+def generate_data_sharded(n_records=100, workers=None, batch_size=DEFAULT_BATCH_SIZE, base_id=2000, seed=42):
+    workers = workers or os.cpu_count() or 1
+    
+    # Cidades são gravadas uma única vez, antes de abrir os shards
+    with get_engine().connect() as conn:
+        setup_extra_cities(conn)
+    
+    today = datetime.now()
+    ensure_partitions(get_engine(), *last_month_range(today))
+    
+    # Divide a faixa de IDs [base_id, base_id + n_records) em blocos disjuntos
+    tamanho_shard = -(-n_records // workers)
+    fornecedores = build_suppliers(seed)
+    shards = [
+        {
+            'shard': k,
+            'n_records': min(tamanho_shard, n_records - k * tamanho_shard),
+            'base_id': base_id + k * tamanho_shard,
+            'seed': seed + k,
+            'fornecedores': fornecedores,
+            'today': today,
+            'batch_size': batch_size,
+        }
+        for k in range(workers) if k * tamanho_shard < n_records
+    ]
+    
+    print(f"🧩 Dividindo {n_records} notas em {len(shards)} shards (seed base {seed})...")
+    inicio = time.perf_counter()
+    total_linhas = 0
+    
+    # spawn: cada processo cria seu próprio engine, sem herdar conexões do pai
+    with multiprocessing.get_context('spawn').Pool(len(shards)) as pool:
+        for k, linhas, segundos in pool.imap_unordered(_run_shard, shards):
+            total_linhas += linhas
+            print(f"   ⚡ Shard {k}: {linhas} linhas em {segundos:.1f}s ({linhas / segundos:,.0f} linhas/s)")
+    
+    segundos = time.perf_counter() - inicio
+    print(f"🏁 Total: {total_linhas} linhas em {segundos:.1f}s ({total_linhas / segundos:,.0f} linhas/s)")
+    
+    # Um único refresh do resumo, depois que todos os shards terminaram
+    if refresh_reporting_views(get_engine()):
+        print("📊 Resumo diário (mv_resumo_diario) atualizado.")
+    return total_linhas
 
 if __name__ == "__main__":
-    generate_data(100) # 100 notas para ficar mais bonito
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Gerador de notas fiscais de material (carga em massa via COPY)")
+    parser.add_argument("--rows", type=int, default=100, help="Quantidade de notas fiscais a gerar") # 100 notas para ficar mais bonito
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Notas por lote/transação")
+    parser.add_argument("--start-id", type=int, default=2000, help="Primeiro ID da faixa gerada")
+    parser.add_argument("--workers", type=int, default=1, help="Processos paralelos (cada um gera um shard disjunto de IDs)")
+    parser.add_argument("--seed", type=int, default=None, help="Semente base para execuções reprodutíveis")
+    args = parser.parse_args()
+    
+    if args.workers > 1:
+        generate_data_sharded(
+            args.rows, workers=args.workers, batch_size=args.batch_size,
+            base_id=args.start_id, seed=args.seed if args.seed is not None else 42
+        )
+    else:
+        generate_data(args.rows, batch_size=args.batch_size, base_id=args.start_id, seed=args.seed)
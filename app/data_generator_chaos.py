@@ -1,23 +1,23 @@
 import os
-import random
+import time
+import argparse
+import multiprocessing
 from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
 from faker import Faker
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from dotenv import load_dotenv
+from db import get_engine
+from partitions import ensure_partitions
+from bulk_loader import DEFAULT_BATCH_SIZE, copy_batch
+from queries import refresh_reporting_views
 
 # python -m streamlit run app/dashboard.py
 
 load_dotenv()
 fake = Faker('pt_BR') 
 
-def get_engine():
-    user = os.getenv("DB_USER")
-    password = os.getenv("DB_PASSWORD")
-    host = os.getenv("DB_HOST")
-    port = os.getenv("DB_PORT")
-    db_name = os.getenv("DB_NAME")
-    return create_engine(f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{db_name}")
-
 def setup_extra_cities(conn):
     # Expande o universo geográfico para testar filtros de Estado/Cidade
     cidades_extras = [
@@ -35,92 +35,180 @@ def setup_extra_cities(conn):
         """))
     conn.commit()
 
-def generate_chaos(n_records=200):
+def build_suppliers(seed=None):
+    # Carteira fixa de fornecedores; com seed, todos os shards compartilham os mesmos CNPJs
+    if seed is not None:
+        fake.seed_instance(seed)
+    return [fake.cnpj().replace('.', '').replace('/', '').replace('-', '') for _ in range(12)]
+
+# DEFINIÇÃO DAS REGRAS DE NEGÓCIO (Conforme Diagrama)
+# Tuplas de (Task_ID, [Status_Possíveis])
+regras_tarefas = {
+    10: [100, 101], # Verificação Duplicada -> Duplicada / Não Duplicada
+    11: [110, 111], # Verificação Divergência -> Com / Sem Divergência
+    12: [120, 121], # Escrituração -> Sucesso / Falha
+    13: [130, 131]  # Pagamento -> Paga / Não Paga
+}
+# Damos mais peso para Escrituração (12) pois é o foco do case, mas geramos os outros também
+pesos_tarefas = [0.1, 0.1, 0.6, 0.2]
+
+tipos_notas = ['MaterialInvoice', 'ServiceInvoice', 'TransportationInvoice']
+
+# Garante cidades válidas para não perder dados no Dashboard
+city_ids = [1, 2, 3, 10, 11, 12, 13, 14, 15, 16]
+
+# Mapeamento Estado
+state_map = {1:1, 2:1, 10:1, 11:1, 3:2, 12:2, 13:2, 14:2, 15:3, 16:3}
+
+def build_chaos_block(rng, base_id, n, fornecedores, start_date):
+    # Sorteia o lote inteiro de uma vez (colunas NumPy) e devolve um bloco colunar por tabela
+    ids = np.arange(base_id, base_id + n, dtype=np.int64)
+    
+    # --- 1. SELEÇÃO ALEATÓRIA DE CENÁRIO ---
+    tipo_nota = np.asarray(tipos_notas)[rng.integers(0, len(tipos_notas), n)]
+    
+    # Etapa do processo e um status válido para aquela tarefa (lookup na matriz tarefa x status)
+    tarefas = np.asarray(list(regras_tarefas))
+    status_por_tarefa = np.asarray(list(regras_tarefas.values()))
+    idx_tarefa = rng.choice(len(tarefas), size=n, p=pesos_tarefas)
+    task_def_id = tarefas[idx_tarefa]
+    status_id = status_por_tarefa[idx_tarefa, rng.integers(0, status_por_tarefa.shape[1], n)]
+
+    # --- 2. DADOS CADASTRAIS ---
+    # state_map vira um vetor indexado pelo id da cidade
+    estado_da_cidade = np.ones(max(state_map) + 1, dtype=np.int64)
+    estado_da_cidade[list(state_map)] = list(state_map.values())
+    cidades = np.asarray(city_ids)
+    supplier_city = cidades[rng.integers(0, len(cidades), n)]
+    customer_city = cidades[rng.integers(0, len(cidades), n)]
+
+    # --- 3. INSERÇÃO ---
+    val = np.round(rng.uniform(100.00, 50000.00, n), 2)
+    cnpj = np.asarray(fornecedores)[rng.integers(0, len(fornecedores), n)]
+    
+    # Datas
+    d_created = np.datetime64(start_date) + rng.integers(0, 90, n).astype('timedelta64[D]')
+    d_completed = d_created + rng.integers(1, 73, n).astype('timedelta64[h]')
+    
+    return {
+        'process_instances': pd.DataFrame({'id': ids, 'type': 'Inbound'}),
+        'tax_documents': pd.DataFrame({
+            'id': ids, 'number': rng.integers(1000, 100000, n), 'type': tipo_nota, 'total_value': val,
+            'supplier_identification_number': cnpj, 'customer_identification_number': '99999999000199',
+            'supplier_city_id': supplier_city, 'customer_city_id': customer_city,
+            'supplier_state_id': estado_da_cidade[supplier_city], 'customer_state_id': estado_da_cidade[customer_city],
+            'process_instance_id': ids
+        }),
+        'tasks': pd.DataFrame({
+            'id': ids, 'created_at': d_created, 'completed_at': d_completed,
+            'task_definition_id': task_def_id, 'status_id': status_id, 'process_instance_id': ids
+        }),
+    }
+
+def generate_chaos(n_records=200, batch_size=DEFAULT_BATCH_SIZE, base_id=10000,
+                   seed=None, fornecedores=None, today=None, setup=True, refresh_views=True):
     engine = get_engine()
     
+    # Semente própria por shard: execuções com a mesma seed geram os mesmos dados
+    rng = np.random.default_rng(seed)
+    
+    total_linhas = 0
+    
     with engine.connect() as conn:
-        setup_extra_cities(conn)
-        print(f"🌪️ Gerando {n_records} registros cobrindo TODOS os cenários do diagrama...")
+        if setup:
+            setup_extra_cities(conn)
+        print(f"🌪️ Gerando {n_records} registros cobrindo TODOS os cenários do diagrama (lotes de {batch_size})...")
         
-        fornecedores = [fake.cnpj().replace('.', '').replace('/', '').replace('-', '') for _ in range(12)]
-        today = datetime.now()
+        if fornecedores is None:
+            fornecedores = build_suppliers(seed)
+        today = today or datetime.now()
         start_date = today - timedelta(days=90) # 3 meses de histórico
+        if setup:
+            # Layout particionado (opcional): meses do histórico gerado (conclusão até 72h após o fim)
+            ensure_partitions(engine, start_date, today + timedelta(days=3))
         
-        base_id = 10000 # IDs altos para segurança
-        
-        # DEFINIÇÃO DAS REGRAS DE NEGÓCIO (Conforme Diagrama)
-        # Tuplas de (Task_ID, [Status_Possíveis])
-        regras_tarefas = {
-            10: [100, 101], # Verificação Duplicada -> Duplicada / Não Duplicada
-            11: [110, 111], # Verificação Divergência -> Com / Sem Divergência
-            12: [120, 121], # Escrituração -> Sucesso / Falha
-            13: [130, 131]  # Pagamento -> Paga / Não Paga
-        }
-        
-        tipos_notas = ['MaterialInvoice', 'ServiceInvoice', 'TransportationInvoice']
-        
-        for i in range(n_records):
-            current_id = base_id + i
+        for inicio in range(0, n_records, batch_size):
+            lote = build_chaos_block(rng, base_id + inicio, min(batch_size, n_records - inicio), fornecedores, start_date)
             
-            # --- 1. SELEÇÃO ALEATÓRIA DE CENÁRIO ---
-            tipo_nota = random.choice(tipos_notas)
+            # Um COPY por tabela e uma transação por lote
+            copy_batch(conn, lote)
+            total_linhas += sum(len(linhas) for linhas in lote.values())
+            print(f"   📦 {min(inicio + batch_size, n_records)}/{n_records} registros gravados")
             
-            # Escolhe qual etapa do processo vamos simular
-            # Damos mais peso para Escrituração (12) pois é o foco do case, mas geramos os outros também
-            task_def_id = random.choices([10, 11, 12, 13], weights=[0.1, 0.1, 0.6, 0.2])[0]
-            
-            # Escolhe um status válido para aquela tarefa
-            status_possiveis = regras_tarefas[task_def_id]
-            status_id = random.choice(status_possiveis)
+        print("✅ Dados COMPLETOS gerados! CTe, Serviços, Materiais e todas as tarefas populadas.")
+    
+    if refresh_views and refresh_reporting_views(engine):
+        print("📊 Resumo diário (mv_resumo_diario) atualizado.")
+    
+    return total_linhas
 
-            # --- 2. DADOS CADASTRAIS ---
-            conn.execute(text(f"INSERT INTO process_instances (id, type) VALUES ({current_id}, 'Inbound')"))
-            
-            # Garante cidades válidas para não perder dados no Dashboard
-            city_ids = [1, 2, 3, 10, 11, 12, 13, 14, 15, 16]
-            supplier_city = random.choice(city_ids)
-            customer_city = random.choice(city_ids)
-            
-            # Mapeamento Estado
-            state_map = {1:1, 2:1, 10:1, 11:1, 3:2, 12:2, 13:2, 14:2, 15:3, 16:3}
-            supplier_state = state_map.get(supplier_city, 1)
-            customer_state = state_map.get(customer_city, 1)
+def _run_shard(shard):
+    # Executado em um processo próprio, com conexão e seed próprias
+    inicio = time.perf_counter()
+    linhas = generate_chaos(
+        shard['n_records'], batch_size=shard['batch_size'], base_id=shard['base_id'],
+        seed=shard['seed'], fornecedores=shard['fornecedores'], today=shard['today'],
+        setup=False, refresh_views=False
+    )
+    return shard['shard'], linhas, time.perf_counter() - inicio
 
-            # --- 3. INSERÇÃO ---
-            val = round(random.uniform(100.00, 50000.00), 2)
-            cnpj = random.choice(fornecedores)
-            
-            sql_nota = text("""
-                INSERT INTO tax_documents (
-                    id, number, type, total_value, 
-                    supplier_identification_number, customer_identification_number, 
-                    supplier_city_id, customer_city_id, 
-                    supplier_state_id, customer_state_id,
-                    process_instance_id
-                ) VALUES (:id, :num, :type, :val, :cnpj, '99999999000199', :sc, :cc, :ss, :cs, :pid)
-            """)
-            
-            conn.execute(sql_nota, {
-                "id": current_id, "num": random.randint(1000, 99999),
-                "type": tipo_nota, "val": val, "cnpj": cnpj,
-                "sc": supplier_city, "cc": customer_city,
-                "ss": supplier_state, "cs": customer_state, "pid": current_id
-            })
-            
-            # Datas
-            d_created = start_date + timedelta(days=random.randint(0, 89))
-            d_completed = d_created + timedelta(hours=random.randint(1, 72))
-            
-            conn.execute(text("""
-                INSERT INTO tasks (id, created_at, completed_at, task_definition_id, status_id, process_instance_id)
-                VALUES (:id, :cr, :co, :td, :st, :pid)
-            """), {
-                "id": current_id, "cr": d_created, "co": d_completed,
-                "td": task_def_id, "st": status_id, "pid": current_id
-            })
-            
-        conn.commit()
-        print("✅ Dados COMPLETOS gerados! CTe, Serviços, Materiais e todas as tarefas populadas.")
+def generate_chaos_sharded(n_records=200, workers=None, batch_size=DEFAULT_BATCH_SIZE, base_id=10000, seed=42):
+    workers = workers or os.cpu_count() or 1
+    
+    # Cidades e estados são gravados uma única vez, antes de abrir os shards
+    with get_engine().connect() as conn:
+        setup_extra_cities(conn)
+    
+    today = datetime.now()
+    ensure_partitions(get_engine(), today - timedelta(days=90), today + timedelta(days=3))
+    
+    # Divide a faixa de IDs [base_id, base_id + n_records) em blocos disjuntos
+    tamanho_shard = -(-n_records // workers)
+    fornecedores = build_suppliers(seed)
+    shards = [
+        {
+            'shard': k,
+            'n_records': min(tamanho_shard, n_records - k * tamanho_shard),
+            'base_id': base_id + k * tamanho_shard,
+            'seed': seed + k,
+            'fornecedores': fornecedores,
+            'today': today,
+            'batch_size': batch_size,
+        }
+        for k in range(workers) if k * tamanho_shard < n_records
+    ]
+    
+    print(f"🧩 Dividindo {n_records} registros em {len(shards)} shards (seed base {seed})...")
+    inicio = time.perf_counter()
+    total_linhas = 0
+    
+    # spawn: cada processo cria seu próprio engine, sem herdar conexões do pai
+    with multiprocessing.get_context('spawn').Pool(len(shards)) as pool:
+        for k, linhas, segundos in pool.imap_unordered(_run_shard, shards):
+            total_linhas += linhas
+            print(f"   ⚡ Shard {k}: {linhas} linhas em {segundos:.1f}s ({linhas / segundos:,.0f} linhas/s)")
+    
+    segundos = time.perf_counter() - inicio
+    print(f"🏁 Total: {total_linhas} linhas em {segundos:.1f}s ({total_linhas / segundos:,.0f} linhas/s)")
+    
+    # Um único refresh do resumo, depois que todos os shards terminaram
+    if refresh_reporting_views(get_engine()):
+        print("📊 Resumo diário (mv_resumo_diario) atualizado.")
+    return total_linhas
 
 if __name__ == "__main__":
-    generate_chaos()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Gerador de cenários caóticos (carga em massa via COPY)")
+    parser.add_argument("--rows", type=int, default=200, help="Quantidade de notas fiscais a gerar")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Notas por lote/transação")
+    parser.add_argument("--start-id", type=int, default=10000, help="Primeiro ID da faixa gerada (IDs altos para segurança)")
+    parser.add_argument("--workers", type=int, default=1, help="Processos paralelos (cada um gera um shard disjunto de IDs)")
+    parser.add_argument("--seed", type=int, default=None, help="Semente base para execuções reprodutíveis")
+    args = parser.parse_args()
+    
+    if args.workers > 1:
+        generate_chaos_sharded(
+            args.rows, workers=args.workers, batch_size=args.batch_size,
+            base_id=args.start_id, seed=args.seed if args.seed is not None else 42
+        )
+    else:
+        generate_chaos(args.rows, batch_size=args.batch_size, base_id=args.start_id, seed=args.seed)
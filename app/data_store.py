@@ -0,0 +1,132 @@
+import time
+import threading
+import pandas as pd
+import queries
+import snapshot
+import result_cache
+import instrumentation
+from instrumentation import span
+from enrichment import enrich, compact_dtypes
+from filter_index import build_filter_index
+from cube import build_cube, apply_delta
+
+# Dataset do dashboard mantido em memória e atualizado de forma incremental
+# O store guarda o frame enriquecido, o watermark (completed_at, task_id), o índice de filtros,
+# o cubo pré-agregado dos gráficos e uma versão
+
+# Código da carga completa (consulta e enriquecimento): réplicas com outra versão não trocam frames
+FULL_DATA_CODE_VERSION = result_cache.code_version('queries', 'enrichment')
+
+def new_store(snapshot_dir=None, cache=None):
+    # snapshot_dir: diretório do snapshot Parquet usado na carga inicial (None = direto do banco)
+    # cache: cache de resultados compartilhado (result_cache.py) para a carga inicial entre processos
+    return {
+        'df': None, 'indice': None, 'cubo': None, 'watermark': None, 'versao': 0, 'atualizado_em': None,
+        'snapshot_dir': snapshot_dir, 'cache': cache, 'lock': threading.Lock()
+    }
+
+def load_enriched(engine):
+    bruto = queries.get_full_data(engine)
+    with span('data_store.enrich'):
+        return enrich(bruto)
+
+def compute_watermark(df):
+    # Última tarefa concluída (o frame é mantido ordenado por (completed_at, task_id), abertas no fim)
+    # e o maior task_id carregado, para o delta trazer só as tarefas abertas novas
+    indice = df['completed_at'].last_valid_index()
+    if indice is None:
+        return None
+    return df.at[indice, 'completed_at'].to_pydatetime(), int(df.at[indice, 'task_id']), int(df['task_id'].max())
+
+# Colunas vindas do banco (queries.DATA_QUERY), comparadas para detectar deltas sem mudança
+SOURCE_COLUMNS = [
+    'id', 'task_id', 'total_value', 'tipo_nota', 'nome_tarefa', 'status_tarefa',
+    'cnpj_fornecedor', 'cidade_fornecedor', 'estado_fornecedor', 'created_at', 'completed_at',
+]
+
+def same_rows(antigas, delta):
+    # O delta só repete linhas que o frame já tem, com os mesmos valores
+    if len(antigas) != len(delta):
+        return False
+    normalizar = lambda df: df[SOURCE_COLUMNS].astype(object).sort_values(['task_id', 'id']).reset_index(drop=True)
+    return normalizar(antigas).equals(normalizar(delta))
+
+def merge_delta(df, delta, watermark):
+    # Substitui as tarefas que voltaram no delta e acrescenta as novas, mantendo a ordem (completed_at, task_id)
+    if delta.empty:
+        return df
+    base = df[~df['task_id'].isin(delta['task_id'])]
+    concluidas = base['completed_at'].notna()
+    novas = delta['completed_at'].notna()
+
+    # Concluídas depois do watermark entram entre as concluídas e as abertas; abertas novas têm id maior
+    # e vão para o fim (o delta chega ordenado do banco). Só uma tarefa nova concluída antes do watermark
+    # exige ordenar tudo
+    wm_completed_at, wm_id, _ = watermark
+    completed_at, task_id = delta.loc[novas, 'completed_at'], delta.loc[novas, 'task_id']
+    em_ordem = ((completed_at > wm_completed_at) | ((completed_at == wm_completed_at) & (task_id > wm_id))).all()
+
+    df = pd.concat([base[concluidas], delta[novas], base[~concluidas], delta[~novas]], ignore_index=True)
+    if not em_ordem:
+        df = df.sort_values(['completed_at', 'task_id'], na_position='last', ignore_index=True)
+    return compact_dtypes(df)
+
+def set_data(store, df, cubo=None):
+    # Frame, watermark, índice de filtros e cubo mudam juntos, sob a mesma versão
+    store['df'] = df
+    store['indice'] = build_filter_index(df)
+    store['cubo'] = build_cube(df) if cubo is None else cubo
+    store['watermark'] = compute_watermark(df)
+    store['versao'] += 1
+
+def load_full(engine, store):
+    if store['snapshot_dir']:
+        with span('data_store.snapshot'):
+            df = snapshot.load_snapshot(engine, store['snapshot_dir'])
+    elif store['cache'] is not None:
+        # Só um processo faz o JOIN para cada versão dos dados; os demais recebem o frame já enriquecido
+        versao = queries.get_data_version(engine)
+        with span('data_store.cache_compartilhado'):
+            df = result_cache.get_or_compute(
+                store['cache'], 'full_data', queries.DATA_QUERY, {'codigo': FULL_DATA_CODE_VERSION}, versao,
+                lambda: load_enriched(engine)
+            )
+    else:
+        df = load_enriched(engine)
+    with span('data_store.indice_cubo'):
+        set_data(store, df)
+    store['atualizado_em'] = time.time()
+
+def refresh(engine, store):
+    """Busca só as tarefas posteriores ao watermark e mescla no frame. Retorna a quantidade de linhas novas"""
+    if store['watermark'] is None:
+        load_full(engine, store)
+        return len(store['df'])
+
+    delta = queries.get_delta(engine, store['watermark'])
+    store['atualizado_em'] = time.time()
+    antigas = store['df'][store['df']['task_id'].isin(delta['task_id'])]
+    if delta.empty or same_rows(antigas, delta):
+        return 0
+
+    with span('data_store.merge_delta'):
+        delta = enrich(delta)
+        df = merge_delta(store['df'], delta, store['watermark'])
+    # O cubo é ajustado só pelas linhas que mudaram (subtrai as antigas, soma as novas)
+    with span('data_store.indice_cubo'):
+        set_data(store, df, apply_delta(store['cubo'], delta, antigas))
+    return len(delta)
+
+def get_data(engine, store, refresh_seconds, force=False):
+    """Retorna {'df', 'indice', 'cubo', 'versao'} consistentes entre si"""
+    # Carga completa na primeira chamada ou quando forçada (botão "Atualizar dados"); depois, no máximo
+    # um delta por intervalo. Miss = chamada que precisou ir ao banco (carga completa ou consulta de delta)
+    instrumentation.count('get_data.chamadas')
+    with store['lock']:
+        if store['df'] is None or force:
+            instrumentation.count('get_data.misses')
+            load_full(engine, store)
+        elif time.time() - store['atualizado_em'] >= refresh_seconds:
+            instrumentation.count('get_data.misses')
+            refresh(engine, store)
+        return {chave: store[chave] for chave in ('df', 'indice', 'cubo', 'versao')}
@@ -0,0 +1,49 @@
+import os
+import threading
+from sqlalchemy import create_engine
+from dotenv import load_dotenv
+
+# Conexão com o banco compartilhada por todos os scripts
+# Um único engine (com pool) por processo, configurado por variáveis de ambiente
+
+load_dotenv()
+
+_engine = None
+_lock = threading.Lock()
+
+def database_url():
+    user = os.getenv("DB_USER")
+    password = os.getenv("DB_PASSWORD")
+    host = os.getenv("DB_HOST")
+    port = os.getenv("DB_PORT")
+    db_name = os.getenv("DB_NAME")
+    return f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{db_name}"
+
+def create_pooled_engine():
+    # statement_timeout 0 = sem limite; keepalives evitam conexões ociosas derrubadas pela rede
+    statement_timeout = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+    return create_engine(
+        database_url(),
+        pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", "30")),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        pool_pre_ping=True,
+        connect_args={
+            'connect_timeout': int(os.getenv("DB_CONNECT_TIMEOUT", "10")),
+            'options': f"-c statement_timeout={statement_timeout}",
+            'keepalives': 1,
+            'keepalives_idle': 30,
+            'keepalives_interval': 10,
+            'keepalives_count': 5,
+            'application_name': os.getenv("DB_APPLICATION_NAME", "case_analytics"),
+        },
+    )
+
+def get_engine():
+    # Criado na primeira chamada e reutilizado pelo processo inteiro
+    global _engine
+    with _lock:
+        if _engine is None:
+            _engine = create_pooled_engine()
+        return _engine
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+# Engenharia de atributos aplicada ao dataset do dashboard
+
+# Colunas de baixa cardinalidade guardadas como category (códigos inteiros + dicionário)
+CATEGORY_COLUMNS = [
+    'tipo_nota', 'nome_tarefa', 'status_tarefa', 'cidade_fornecedor', 'estado_fornecedor',
+    'cnpj_fornecedor', 'cnpj_formatado',
+]
+
+def format_cnpj(value):
+    # Aplica a máscara de CNPJ
+    if pd.isna(value): return ""
+    v = str(value).zfill(14)
+    return f"{v[:2]}.{v[2:5]}.{v[5:8]}/{v[8:12]}-{v[12:]}"
+
+def format_cnpj_column(values):
+    # Máscara calculada uma vez por CNPJ distinto (fatiamento vetorizado) e expandida pelos códigos
+    cat = pd.Categorical(values)
+    v = pd.Series(cat.categories.astype(str)).str.zfill(14)
+    mascaras = (v.str[:2] + '.' + v.str[2:5] + '.' + v.str[5:8] + '/' + v.str[8:12] + '-' + v.str[12:]).to_numpy()
+
+    # Código -1 (nulo) aponta para a última posição: string vazia, como em format_cnpj
+    mascaras = np.append(mascaras, '').astype(object)
+    unicas, codigos = np.unique(mascaras, return_inverse=True)
+    return pd.Series(pd.Categorical.from_codes(codigos[cat.codes], categories=unicas), index=values.index)
+
+def compact_dtypes(df):
+    # Reaplica category depois de concat/merge (categorias diferentes voltam como object)
+    for coluna in CATEGORY_COLUMNS:
+        if coluna in df and not isinstance(df[coluna].dtype, pd.CategoricalDtype):
+            df[coluna] = df[coluna].astype('category')
+    return df
+
+def enrich(df):
+    # Engenharia de Atributos
+    df['lead_time_horas'] = (df['completed_at'] - df['created_at']).dt.total_seconds() / 3600
+    # datetime64 normalizado (8 bytes) em vez de objetos datetime.date
+    df['data_escrituracao'] = df['completed_at'].dt.normalize()
+
+    # Tratamento de CNPJ
+    df['cnpj_formatado'] = format_cnpj_column(df['cnpj_fornecedor'])
+
+    return compact_dtypes(df)
+
+def enrich_legacy(df):
+    # Versão anterior (objetos Python e máscara linha a linha), mantida para comparação de memória
+    df['lead_time_horas'] = (df['completed_at'] - df['created_at']).dt.total_seconds() / 3600
+    df['data_escrituracao'] = df['completed_at'].dt.date
+    df['cnpj_fornecedor'] = df['cnpj_fornecedor'].astype(str)
+    df['cnpj_formatado'] = df['cnpj_fornecedor'].apply(format_cnpj)
+    return df
+
+def memory_report(antes, depois):
+    # Bytes por linha de cada coluna (deep=True conta o conteúdo das strings)
+    linhas = max(len(antes), 1)
+    relatorio = pd.DataFrame({
+        'antes_bytes_linha': antes.memory_usage(deep=True, index=False) / linhas,
+        'depois_bytes_linha': depois.memory_usage(deep=True, index=False) / linhas,
+        'dtype_depois': depois.dtypes.astype(str),
+    })
+    relatorio.loc['TOTAL', ['antes_bytes_linha', 'depois_bytes_linha']] = relatorio[['antes_bytes_linha', 'depois_bytes_linha']].sum()
+    return relatorio
+
+if __name__ == "__main__":
+    # python enrichment.py -> compara o consumo de memória das duas versões sobre o dataset atual
+    import queries
+    from db import get_engine
+
+    bruto = queries.get_full_data(get_engine())
+    print(f"Linhas: {len(bruto)}")
+    print(memory_report(enrich_legacy(bruto.copy()), enrich(bruto.copy())).round(1).to_string())
@@ -0,0 +1,84 @@
+import os
+import re
+import argparse
+from datetime import date, timedelta
+from sqlalchemy import text
+from main import REPORT_QUERY, REPORT_QUERY_ITEMS
+from db import get_engine
+import queries
+
+# Compara os planos (EXPLAIN ANALYZE) das consultas de relatório antes e depois dos índices
+# python explain_report.py --reset
+
+INDEX_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'init_scripts', '03_indexes.sql')
+
+def default_filters():
+    # Filtro equivalente ao estado inicial do dashboard (últimos 90 dias, todas as opções)
+    hoje = date.today()
+    return {
+        'periodo': (hoje - timedelta(days=90), hoje),
+        'tipo_nota': ['MaterialInvoice', 'ServiceInvoice', 'TransportationInvoice'],
+        'nome_tarefa': ['Verificação de Nota Duplicada', 'Verificação de Divergências na Nota',
+                        'Escrituração da Nota', 'Pagamento da Nota'],
+        'status_tarefa': ['Nota Duplicada', 'Nota não é Duplicada', 'Nota com Divergência', 'Nota sem Divergência',
+                          'Nota Escriturada com Sucesso', 'Nota não Escriturada', 'Nota Paga', 'Nota não Paga'],
+        'estado_fornecedor': ['Minas Gerais', 'São Paulo', 'Paraná'],
+    }
+
+def report_queries():
+    # (nome, sql, params) de cada consulta analisada
+    filtros = default_filters()
+    where, params = queries.build_where(filtros)
+    return [
+        ("Relatório mensal (main.py)", REPORT_QUERY.strip().rstrip(';'), {}),
+        ("Relatório mensal via items (validação)", REPORT_QUERY_ITEMS.strip().rstrip(';'), {}),
+        ("Dataset do dashboard (modo pandas)", f"{queries.DATA_QUERY} ORDER BY t.completed_at, t.id", {}),
+        ("KPIs filtrados (modo sql)", f"""
+            SELECT SUM(td.total_value), COUNT(td.id), COUNT(DISTINCT td.supplier_identification_number)
+            {queries.FROM_JOINS} {where}
+        """, params),
+    ]
+
+def explain(conn, sql, params):
+    linhas = conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {sql}"), params).scalars().all()
+    tempo = next((l for l in reversed(linhas) if l.startswith('Execution Time')), '')
+    return '\n'.join(linhas), tempo
+
+def run_explain(conn, titulo):
+    tempos = {}
+    print(f"\n{'=' * 20} {titulo} {'=' * 20}")
+    for nome, sql, params in report_queries():
+        plano, tempo = explain(conn, sql, params)
+        tempos[nome] = tempo
+        print(f"\n--- {nome} ---\n{plano}")
+    return tempos
+
+def index_names(script):
+    return re.findall(r'CREATE INDEX IF NOT EXISTS (\w+)', script)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EXPLAIN ANALYZE das consultas de relatório antes e depois dos índices")
+    parser.add_argument("--reset", action="store_true", help="Remove os índices de 03_indexes.sql antes da medição inicial")
+    args = parser.parse_args()
+
+    with open(INDEX_SCRIPT, encoding='utf-8') as f:
+        script = f.read()
+
+    engine = get_engine()
+    with engine.connect() as conn:
+        if args.reset:
+            for nome in index_names(script):
+                conn.execute(text(f"DROP INDEX IF EXISTS {nome}"))
+            conn.commit()
+
+        antes = run_explain(conn, "ANTES DOS ÍNDICES")
+
+        print("\nAplicando init_scripts/03_indexes.sql...")
+        conn.exec_driver_sql(script)
+        conn.commit()
+
+        depois = run_explain(conn, "DEPOIS DOS ÍNDICES")
+
+    print(f"\n{'=' * 20} RESUMO {'=' * 20}")
+    for nome in antes:
+        print(f"{nome}:\n   antes:  {antes[nome]}\n   depois: {depois[nome]}")
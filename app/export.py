@@ -0,0 +1,45 @@
+import io
+import os
+import tempfile
+import pandas as pd
+from report_writers import write_xlsx_constant_memory, write_csv_gz, write_parquet
+
+# Exportação do recorte filtrado do dashboard
+
+# formato -> (função de escrita, extensão, mime) usados pelo download do dashboard
+EXPORT_FORMATS = {
+    'xlsx': (write_xlsx_constant_memory, 'xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'csv.gz': (write_csv_gz, 'csv.gz', 'application/gzip'),
+    'parquet': (write_parquet, 'parquet', 'application/vnd.apache.parquet'),
+}
+
+def to_excel_bytes(df, sheet_name='Dados Filtrados'):
+    # Converte o DataFrame em um arquivo Excel em memória
+    output = io.BytesIO()
+    # Usando engine openpyxl para gerar o arquivo .xlsx
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False, sheet_name=sheet_name)
+    return output.getvalue()
+
+def _chunks(df, chunksize, progresso):
+    # Fatias do frame; progresso(fração) é chamado depois que cada fatia é consumida pelo writer
+    total = len(df)
+    for inicio in range(0, total, chunksize):
+        yield df.iloc[inicio:inicio + chunksize]
+        if progresso is not None:
+            progresso(min(inicio + chunksize, total) / total)
+
+def export_bytes(df, formato='xlsx', progresso=None, chunksize=50_000):
+    """Grava o frame no formato pedido (em streaming, via arquivo temporário) e retorna o conteúdo"""
+    writer, extensao, _ = EXPORT_FORMATS[formato]
+    fd, path = tempfile.mkstemp(suffix=f".{extensao}")
+    os.close(fd)
+    try:
+        if formato == 'xlsx':
+            writer(_chunks(df, chunksize, progresso), path, sheet_name='Dados Filtrados')
+        else:
+            writer(_chunks(df, chunksize, progresso), path)
+        with open(path, 'rb') as f:
+            return f.read()
+    finally:
+        os.remove(path)
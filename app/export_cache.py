@@ -0,0 +1,69 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import instrumentation
+from filter_index import FILTER_COLUMNS
+
+# Cache dos arquivos exportados pelo dashboard, compartilhado entre sessões
+# A chave é (versão dos dados, formato, filtros normalizados): o conteúdo do DataFrame nunca é hasheado
+# LRU limitado pelo total de bytes; a geração roda em threads próprias, com progresso consultável
+
+def new_cache(max_bytes, workers=2):
+    return {
+        'itens': OrderedDict(), 'bytes': 0, 'max_bytes': max_bytes, 'tarefas': {},
+        'lock': threading.Lock(),
+        'executor': ThreadPoolExecutor(max_workers=workers, thread_name_prefix="exportacao"),
+    }
+
+def cache_key(versao, formato, filtros):
+    # A ordem das opções marcadas no multiselect não muda o resultado
+    inicio, fim = filtros['periodo']
+    selecoes = tuple(tuple(sorted(map(str, filtros[coluna]))) for coluna in FILTER_COLUMNS)
+    return (versao, formato, str(inicio), str(fim)) + selecoes
+
+def _store(cache, chave, dados):
+    # Chamado com o lock. Descarta os menos usados até caber; um arquivo maior que o limite fica sozinho
+    cache['itens'][chave] = dados
+    cache['bytes'] += len(dados)
+    while cache['bytes'] > cache['max_bytes'] and len(cache['itens']) > 1:
+        _, antigo = cache['itens'].popitem(last=False)
+        cache['bytes'] -= len(antigo)
+
+def status(cache, chave):
+    """Retorna ('pronto', bytes), ('gerando', fração concluída), ('erro', mensagem) ou (None, None)"""
+    with cache['lock']:
+        if chave in cache['itens']:
+            cache['itens'].move_to_end(chave)
+            return 'pronto', cache['itens'][chave]
+        tarefa = cache['tarefas'].get(chave)
+        if tarefa is None:
+            return None, None
+        if tarefa['erro'] is not None:
+            return 'erro', tarefa['erro']
+        return 'gerando', tarefa['progresso']
+
+def request(cache, chave, gerar):
+    # Agenda gerar(progresso) -> bytes, a menos que a chave já esteja pronta ou em andamento
+    with cache['lock']:
+        tarefa = cache['tarefas'].get(chave)
+        if chave in cache['itens'] or (tarefa is not None and tarefa['erro'] is None):
+            return
+        instrumentation.count('exportacao.misses')
+        tarefa = {'progresso': 0.0, 'erro': None}
+        cache['tarefas'][chave] = tarefa
+    cache['executor'].submit(_run, cache, chave, tarefa, gerar)
+
+def _run(cache, chave, tarefa, gerar):
+    def progresso(fracao):
+        tarefa['progresso'] = fracao
+
+    try:
+        dados = gerar(progresso)
+    except Exception as e:
+        with cache['lock']:
+            tarefa['erro'] = str(e)
+        return
+
+    with cache['lock']:
+        _store(cache, chave, dados)
+        del cache['tarefas'][chave]
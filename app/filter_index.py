@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+# Índice de filtros da barra lateral, construído uma vez por carga de dados:
+# - um bitmap (np.packbits) por valor de cada coluna filtrável
+# - o vetor de datas ordenado, para recortar o período com busca binária
+# Uma mudança de filtro vira OR/AND de bitmaps restritos à faixa de datas, sem varrer o frame
+
+FILTER_COLUMNS = ['tipo_nota', 'nome_tarefa', 'status_tarefa', 'estado_fornecedor']
+
+def build_filter_index(df):
+    # O frame precisa estar ordenado por data (NaT no fim), como o data_store o mantém
+    datas = df['data_escrituracao'].to_numpy(dtype='datetime64[ns]')
+    validas = int(np.count_nonzero(~np.isnat(datas)))
+    if np.any(datas[1:validas] < datas[:validas - 1]):
+        raise ValueError("build_filter_index exige o frame ordenado por data_escrituracao")
+
+    bitmaps = {}
+    nao_nulos = {}
+    for coluna in FILTER_COLUMNS:
+        cat = pd.Categorical(df[coluna])
+        codigos = cat.codes
+        bitmaps[coluna] = {valor: np.packbits(codigos == i) for i, valor in enumerate(cat.categories)}
+        # Só é preciso um bitmap de "não nulo" quando a coluna tem nulos
+        nao_nulos[coluna] = np.packbits(codigos >= 0) if np.any(codigos < 0) else None
+
+    return {'linhas': len(df), 'datas': datas[:validas], 'bitmaps': bitmaps, 'nao_nulos': nao_nulos}
+
+def filter_positions(indice, filtros):
+    """Posições (iloc) das linhas que atendem aos filtros, na ordem do frame"""
+    inicio = pd.Timestamp(filtros['periodo'][0]).to_datetime64()
+    fim = pd.Timestamp(filtros['periodo'][1]).to_datetime64()
+    lo = int(np.searchsorted(indice['datas'], inicio, side='left'))
+    hi = int(np.searchsorted(indice['datas'], fim, side='right'))
+    if lo >= hi:
+        return np.empty(0, dtype=np.int64)
+
+    # Faixa de bytes dos bitmaps que cobre [lo, hi)
+    b0, b1 = lo // 8, (hi + 7) // 8
+    resultado = None
+    for coluna, por_valor in indice['bitmaps'].items():
+        selecionados = [valor for valor in filtros[coluna] if valor in por_valor]
+        if len(selecionados) == len(por_valor):
+            # Todos os valores marcados: só exclui os nulos (como o isin)
+            parcial = indice['nao_nulos'][coluna]
+            if parcial is None:
+                continue
+            parcial = parcial[b0:b1]
+        else:
+            parcial = np.zeros(b1 - b0, dtype=np.uint8)
+            for valor in selecionados:
+                parcial |= por_valor[valor][b0:b1]
+        resultado = parcial if resultado is None else resultado & parcial
+
+    if resultado is None:
+        return np.arange(lo, hi)
+
+    posicoes = np.flatnonzero(np.unpackbits(resultado)) + b0 * 8
+    return posicoes[(posicoes >= lo) & (posicoes < hi)]
+
+def apply_index(df, indice, filtros):
+    return df.take(filter_positions(indice, filtros))
@@ -0,0 +1,85 @@
+import json
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Instrumentação leve do dashboard: spans de tempo por etapa, métricas de SQL e contadores de cache
+# Cada rerun do Streamlit abre uma "execução"; fora de uma execução os spans são ignorados
+
+_execucao = contextvars.ContextVar('perf_execucao', default=None)
+_contadores = {}
+_lock = threading.Lock()
+
+logger = logging.getLogger('perf')
+
+def configure_log(path):
+    # Exporta um JSON por linha (uma linha por rerun) no arquivo indicado
+    if not path or logger.handlers:
+        return
+    handler = logging.FileHandler(path, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+def start_run(nome='rerun'):
+    execucao = {'nome': nome, 'inicio': time.perf_counter(), 'spans': [], 'sql': []}
+    _execucao.set(execucao)
+    return execucao
+
+@contextmanager
+def span(etapa):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        execucao = _execucao.get()
+        if execucao is not None:
+            execucao['spans'].append({'etapa': etapa, 'ms': round((time.perf_counter() - inicio) * 1000, 2)})
+
+def record_sql(consulta, segundos, linhas, bytes_dataframe):
+    # bytes_dataframe: memória do DataFrame retornado (com o conteúdo das strings), não o tráfego do banco
+    execucao = _execucao.get()
+    if execucao is not None:
+        execucao['sql'].append({
+            'consulta': consulta, 'ms': round(segundos * 1000, 2),
+            'linhas': int(linhas), 'bytes_dataframe': int(bytes_dataframe),
+        })
+
+def count(nome, n=1):
+    with _lock:
+        _contadores[nome] = _contadores.get(nome, 0) + n
+
+def counters():
+    with _lock:
+        return dict(_contadores)
+
+def cache_stats(nome):
+    # Acertos = chamadas que não precisaram recalcular (misses contados dentro da função cacheada)
+    contadores = counters()
+    chamadas = contadores.get(f"{nome}.chamadas", 0)
+    misses = contadores.get(f"{nome}.misses", 0)
+    return {
+        'chamadas': chamadas, 'hits': chamadas - misses, 'misses': misses,
+        'hit_ratio': round((chamadas - misses) / chamadas, 3) if chamadas else None,
+    }
+
+def finish_run():
+    """Fecha a execução atual, grava o registro no log estruturado e o devolve"""
+    execucao = _execucao.get()
+    if execucao is None:
+        return None
+    _execucao.set(None)
+
+    registro = {
+        'nome': execucao['nome'],
+        'timestamp': time.time(),
+        'total_ms': round((time.perf_counter() - execucao['inicio']) * 1000, 2),
+        'spans': execucao['spans'],
+        'sql': execucao['sql'],
+        'contadores': counters(),
+    }
+    logger.info(json.dumps(registro, ensure_ascii=False, default=str))
+    return registro
@@ -1,57 +1,166 @@
 import os
+import json
+import queue
+import argparse
 import pandas as pd
-from sqlalchemy import create_engine
+from sqlalchemy import text
 from dotenv import load_dotenv
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from report_writers import WRITERS
+from db import get_engine
 
 # python ./app/main.py
+# python ./app/main.py --formato csv.gz --chunksize 100000
+# python ./app/main.py --inicio 2025-01 --fim 2025-12 --saida relatorios --workers 4
+# python ./app/main.py --validar
 
 load_dotenv()
 
-def get_db_connection():
-    user = os.getenv("DB_USER")
-    password = os.getenv("DB_PASSWORD")
-    host = os.getenv("DB_HOST")
-    port = os.getenv("DB_PORT")
-    db_name = os.getenv("DB_NAME")
-    
-    return create_engine(f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{db_name}")
+# Pedidos de compra lidos do consolidado por nota (init_scripts/05_purchase_orders.sql):
+# uma linha por nota, sem multiplicar pelos itens nem GROUP BY / DISTINCT no relatório
+REPORT_QUERY = """
+SELECT
+    td.id AS "ID Nota Fiscal",
+    td.number AS "Número da Nota",
+    po.purchase_orders AS "Pedidos de Compra",
+    td.supplier_identification_number AS "CNPJ Fornecedor",
+    city_fornecedor.name AS "Cidade Fornecedor",
+    td.customer_identification_number AS "CNPJ Tomador",
+    city_tomador.name AS "Cidade Tomador",
+    TO_CHAR(t.completed_at, 'DD/MM/YYYY') AS "Data Escrituração"
+FROM tax_documents td
+INNER JOIN tasks t ON td.process_instance_id = t.process_instance_id
+INNER JOIN cities city_fornecedor ON td.supplier_city_id = city_fornecedor.id
+INNER JOIN cities city_tomador ON td.customer_city_id = city_tomador.id
+LEFT JOIN tax_document_purchase_orders po ON po.tax_document_id = td.id
+WHERE
+    td.type = 'MaterialInvoice'
+    AND t.task_definition_id = 12
+    AND t.status_id = 120
+    AND t.completed_at >= DATE_TRUNC('month', CURRENT_DATE - INTERVAL '1 month')
+    AND t.completed_at < DATE_TRUNC('month', CURRENT_DATE)
+ORDER BY
+    t.completed_at DESC;
+"""
+
+# Versão original, agregando os itens a cada execução (referência para validação e comparação de planos)
+REPORT_QUERY_ITEMS = """
+SELECT
+    td.id AS "ID Nota Fiscal",
+    td.number AS "Número da Nota",
+    STRING_AGG(DISTINCT i.purchase_order, ', ') AS "Pedidos de Compra",
+    td.supplier_identification_number AS "CNPJ Fornecedor",
+    city_fornecedor.name AS "Cidade Fornecedor",
+    td.customer_identification_number AS "CNPJ Tomador",
+    city_tomador.name AS "Cidade Tomador",
+    TO_CHAR(t.completed_at, 'DD/MM/YYYY') AS "Data Escrituração"
+FROM tax_documents td
+INNER JOIN tasks t ON td.process_instance_id = t.process_instance_id
+INNER JOIN cities city_fornecedor ON td.supplier_city_id = city_fornecedor.id
+INNER JOIN cities city_tomador ON td.customer_city_id = city_tomador.id
+LEFT JOIN items i ON td.id = i.tax_document_id
+WHERE 
+    td.type = 'MaterialInvoice'
+    AND t.task_definition_id = 12
+    AND t.status_id = 120
+    AND t.completed_at >= DATE_TRUNC('month', CURRENT_DATE - INTERVAL '1 month')
+    AND t.completed_at < DATE_TRUNC('month', CURRENT_DATE)
+GROUP BY 
+    td.id, td.number, td.supplier_identification_number, 
+    city_fornecedor.name, td.customer_identification_number, 
+    city_tomador.name, t.completed_at
+ORDER BY 
+    t.completed_at DESC;
+"""
+
+# Filtros do relatório parametrizado (tipos de nota, tarefas, status e intervalo de meses)
+BATCH_WHERE = """
+WHERE
+    td.type = ANY(:tipos)
+    AND t.task_definition_id = ANY(:tarefas)
+    AND t.status_id = ANY(:status)
+    AND t.completed_at >= :inicio
+    AND t.completed_at < :fim
+"""
+
+# Mesmos JOINs do REPORT_QUERY, compartilhados pelo relatório e pela impressão digital dos meses
+BATCH_FROM = """
+FROM tax_documents td
+INNER JOIN tasks t ON td.process_instance_id = t.process_instance_id
+INNER JOIN cities city_fornecedor ON td.supplier_city_id = city_fornecedor.id
+INNER JOIN cities city_tomador ON td.customer_city_id = city_tomador.id
+LEFT JOIN tax_document_purchase_orders po ON po.tax_document_id = td.id
+"""
+
+# Mesmas colunas do REPORT_QUERY, ordenadas por mês: uma única passada é dividida em um arquivo por período
+BATCH_QUERY = """
+SELECT
+    TO_CHAR(t.completed_at, 'YYYY-MM') AS ano_mes,
+    td.id AS "ID Nota Fiscal",
+    td.number AS "Número da Nota",
+    po.purchase_orders AS "Pedidos de Compra",
+    td.supplier_identification_number AS "CNPJ Fornecedor",
+    city_fornecedor.name AS "Cidade Fornecedor",
+    td.customer_identification_number AS "CNPJ Tomador",
+    city_tomador.name AS "Cidade Tomador",
+    TO_CHAR(t.completed_at, 'DD/MM/YYYY') AS "Data Escrituração"
+""" + BATCH_FROM + BATCH_WHERE + """
+    AND DATE_TRUNC('month', t.completed_at) = ANY(:meses)
+ORDER BY
+    DATE_TRUNC('month', t.completed_at), t.completed_at DESC
+"""
+
+# Notas cujo consolidado difere da agregação direta sobre items (vazio = consolidado correto)
+PURCHASE_ORDERS_CHECK_QUERY = """
+SELECT
+    COALESCE(esperado.tax_document_id, po.tax_document_id) AS tax_document_id,
+    esperado.purchase_orders AS esperado,
+    po.purchase_orders AS consolidado
+FROM (
+    SELECT tax_document_id, STRING_AGG(DISTINCT purchase_order, ', ') AS purchase_orders
+    FROM items
+    WHERE tax_document_id IS NOT NULL
+    GROUP BY tax_document_id
+) esperado
+FULL JOIN tax_document_purchase_orders po ON po.tax_document_id = esperado.tax_document_id
+WHERE esperado.tax_document_id IS NULL
+   OR po.tax_document_id IS NULL
+   OR esperado.purchase_orders IS DISTINCT FROM po.purchase_orders
+"""
+
+# Impressão digital de cada mês do filtro, usada para pular arquivos já atualizados: mesmas linhas do
+# BATCH_QUERY, com um md5 das colunas do relatório (pega também edições em linhas já exportadas)
+PERIOD_FINGERPRINT_QUERY = """
+SELECT
+    TO_CHAR(t.completed_at, 'YYYY-MM') AS ano_mes,
+    COUNT(*) AS linhas,
+    MAX(t.id) AS max_task_id,
+    MAX(td.id) AS max_nota_id,
+    MD5(STRING_AGG(
+        ROW(
+            td.id, td.number, po.purchase_orders, td.supplier_identification_number, city_fornecedor.name,
+            td.customer_identification_number, city_tomador.name, t.completed_at
+        )::text,
+        ',' ORDER BY td.id, t.id
+    )) AS checksum
+""" + BATCH_FROM + BATCH_WHERE + """
+GROUP BY 1
+ORDER BY 1
+"""
+
+# Blocos aguardando cada writer (limita a memória quando a leitura é mais rápida que a escrita)
+QUEUE_CHUNKS = 4
+
+_FIM = object()
+_ABORTAR = object()
 
 def extract_data():
-    query = """
-    SELECT
-        td.id AS "ID Nota Fiscal",
-        td.number AS "Número da Nota",
-        STRING_AGG(DISTINCT i.purchase_order, ', ') AS "Pedidos de Compra",
-        td.supplier_identification_number AS "CNPJ Fornecedor",
-        city_fornecedor.name AS "Cidade Fornecedor",
-        td.customer_identification_number AS "CNPJ Tomador",
-        city_tomador.name AS "Cidade Tomador",
-        TO_CHAR(t.completed_at, 'DD/MM/YYYY') AS "Data Escrituração"
-    FROM tax_documents td
-    INNER JOIN tasks t ON td.process_instance_id = t.process_instance_id
-    INNER JOIN cities city_fornecedor ON td.supplier_city_id = city_fornecedor.id
-    INNER JOIN cities city_tomador ON td.customer_city_id = city_tomador.id
-    LEFT JOIN items i ON td.id = i.tax_document_id
-    WHERE 
-        td.type = 'MaterialInvoice'
-        AND t.task_definition_id = 12
-        AND t.status_id = 120
-        AND t.completed_at >= DATE_TRUNC('month', CURRENT_DATE - INTERVAL '1 month')
-        AND t.completed_at < DATE_TRUNC('month', CURRENT_DATE)
-    GROUP BY 
-        td.id, td.number, td.supplier_identification_number, 
-        city_fornecedor.name, td.customer_identification_number, 
-        city_tomador.name, t.completed_at
-    ORDER BY 
-        t.completed_at DESC;
-    """
-    
     print("Conectando ao banco e executando a query...")
-    engine = get_db_connection()
-    
+    engine = get_engine()
+
     try:
-        df = pd.read_sql(query, engine)
+        df = pd.read_sql(REPORT_QUERY, engine)
         print(f"Dados extraídos com sucesso!")
         return df
     except Exception as e:
@@ -67,8 +176,187 @@ def save_report(df):
     else:
         print("Nenhum dado encontrado")
 
+def stream_data(engine, chunksize=50_000, query=REPORT_QUERY, params=None):
+    # Cursor do lado do servidor: o resultado chega em blocos de `chunksize` linhas
+    with engine.connect().execution_options(stream_results=True, max_row_buffer=chunksize) as conn:
+        for chunk in pd.read_sql(text(query), conn, params=params, chunksize=chunksize):
+            yield chunk
+
+def export_report(formato='xlsx', chunksize=50_000):
+    # Caminho em streaming: memória constante independente do volume do mês
+    writer, extensao = WRITERS[formato]
+    filename = f"relatorio_notas_{datetime.now().strftime('%Y-%m-%d')}.{extensao}"
+
+    print("Conectando ao banco e executando a query (streaming)...")
+    engine = get_engine()
+
+    try:
+        total = writer(stream_data(engine, chunksize), filename)
+    except Exception as e:
+        print(f"Erro ao gerar o relatório: {e}")
+        return None
+
+    if total == 0:
+        os.remove(filename)
+        print("Nenhum dado encontrado")
+        return None
+
+    print(f"Relatório ({total} linhas): {os.path.abspath(filename)}")
+    return filename
+
+def validate_purchase_orders(engine):
+    """Compara o consolidado de pedidos de compra com items. Retorna as notas divergentes"""
+    divergentes = pd.read_sql(text(PURCHASE_ORDERS_CHECK_QUERY), engine)
+    if divergentes.empty:
+        print("✅ Pedidos de compra consolidados conferem com items")
+    else:
+        print(f"❌ {len(divergentes)} nota(s) com pedidos de compra divergentes:")
+        print(divergentes.head(20).to_string(index=False))
+    return divergentes
+
+def month_start(texto):
+    # 'YYYY-MM' -> primeiro dia do mês
+    return datetime.strptime(texto, '%Y-%m')
+
+def next_month(inicio):
+    return (inicio + timedelta(days=32)).replace(day=1)
+
+def last_month():
+    return (date.today().replace(day=1) - timedelta(days=1)).strftime('%Y-%m')
+
+def report_path(saida, ano_mes, extensao):
+    return os.path.join(saida, f"relatorio_notas_{ano_mes}.{extensao}")
+
+def period_fingerprints(engine, params):
+    df = pd.read_sql(text(PERIOD_FINGERPRINT_QUERY), engine, params=params)
+    return {
+        row.ano_mes: [int(row.linhas), int(row.max_task_id), int(row.max_nota_id), row.checksum]
+        for row in df.itertuples()
+    }
+
+def read_meta(path):
+    try:
+        with open(f"{path}.meta.json", encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def is_up_to_date(path, fingerprint, filtros):
+    # O arquivo só é reaproveitado se foi gerado com os mesmos filtros e o conteúdo do mês não mudou no banco
+    meta = read_meta(path)
+    return (
+        os.path.exists(path) and meta is not None
+        and meta.get('fingerprint') == fingerprint and meta.get('filtros') == filtros
+    )
+
+def _queue_chunks(fila, encerrada):
+    # encerrada vira True quando o marcador de fim (ou de erro na leitura) é consumido
+    while True:
+        chunk = fila.get()
+        if chunk is _FIM or chunk is _ABORTAR:
+            encerrada[0] = True
+            if chunk is _ABORTAR:
+                raise RuntimeError("leitura interrompida")
+            return
+        yield chunk
+
+def _write_period(writer, fila, path, meta):
+    # Grava em um arquivo temporário e só publica (arquivo + .meta.json) quando o mês termina
+    parcial = f"{path}.parcial"
+    encerrada = [False]
+    try:
+        total = writer(_queue_chunks(fila, encerrada), parcial)
+    except BaseException:
+        # Esvazia a fila para não travar a leitura e descarta o arquivo incompleto
+        while not encerrada[0]:
+            item = fila.get()
+            encerrada[0] = item is _FIM or item is _ABORTAR
+        if os.path.exists(parcial):
+            os.remove(parcial)
+        raise
+
+    os.replace(parcial, path)
+    with open(f"{path}.meta.json", 'w', encoding='utf-8') as f:
+        json.dump({**meta, 'linhas_arquivo': total, 'gerado_em': datetime.now().isoformat(timespec='seconds')}, f, indent=2)
+    return path, total
+
+def run_batch(inicio, fim, tipos, tarefas, status, saida='.', formato='xlsx', workers=4, chunksize=50_000, forcar=False):
+    """Gera um arquivo por mês entre inicio e fim ('YYYY-MM', inclusive) numa única consulta. Retorna [(arquivo, linhas)]"""
+    writer, extensao = WRITERS[formato]
+    filtros = {'tipos': list(tipos), 'tarefas': list(tarefas), 'status': list(status)}
+    params = {**filtros, 'inicio': month_start(inicio), 'fim': next_month(month_start(fim))}
+
+    os.makedirs(saida, exist_ok=True)
+    engine = get_engine()
+
+    # Meses com dados no filtro; os que já têm arquivo atualizado ficam fora da consulta
+    pendentes = {}
+    for ano_mes, fingerprint in period_fingerprints(engine, params).items():
+        if not forcar and is_up_to_date(report_path(saida, ano_mes, extensao), fingerprint, filtros):
+            print(f"   ⏭️ {ano_mes}: arquivo atualizado, pulando")
+            continue
+        pendentes[ano_mes] = fingerprint
+
+    if not pendentes:
+        print("Nenhum período a gerar")
+        return []
+
+    print(f"Gerando {len(pendentes)} período(s) em uma passada (streaming, {workers} writers)...")
+    meses = [month_start(ano_mes) for ano_mes in pendentes]
+    filas, futuros = {}, []
+    atual = None
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="relatorio") as executor:
+        try:
+            for chunk in stream_data(engine, chunksize, BATCH_QUERY, {**params, 'meses': meses}):
+                # Resultado ordenado por mês: quando um mês novo aparece, o anterior está completo
+                for ano_mes, parte in chunk.groupby('ano_mes', sort=False):
+                    if ano_mes != atual:
+                        if atual is not None:
+                            filas[atual].put(_FIM)
+                        atual = ano_mes
+                        filas[ano_mes] = queue.Queue(maxsize=QUEUE_CHUNKS)
+                        meta = {'fingerprint': pendentes[ano_mes], 'filtros': filtros, 'formato': formato}
+                        futuros.append(executor.submit(
+                            _write_period, writer, filas[ano_mes], report_path(saida, ano_mes, extensao), meta
+                        ))
+                    filas[ano_mes].put(parte.drop(columns='ano_mes'))
+        except BaseException:
+            if atual is not None:
+                filas[atual].put(_ABORTAR)
+            raise
+        if atual is not None:
+            filas[atual].put(_FIM)
+
+    gerados = [futuro.result() for futuro in futuros]
+    for path, total in gerados:
+        print(f"   📄 {os.path.abspath(path)} ({total} linhas)")
+    return gerados
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Relatório de notas escrituradas, um arquivo por mês do período")
+    parser.add_argument("--inicio", default=last_month(), help="Primeiro mês (YYYY-MM); padrão: mês passado")
+    parser.add_argument("--fim", help="Último mês, inclusive (YYYY-MM); padrão: igual ao início")
+    parser.add_argument("--tipos", nargs='+', default=['MaterialInvoice'], help="Tipos de nota")
+    parser.add_argument("--tarefas", type=int, nargs='+', default=[12], help="IDs de task_definitions")
+    parser.add_argument("--status", type=int, nargs='+', default=[120], help="IDs de status")
+    parser.add_argument("--saida", default='.', help="Diretório dos arquivos gerados")
+    parser.add_argument("--formato", choices=list(WRITERS), default='xlsx', help="Formato do arquivo de saída")
+    parser.add_argument("--chunksize", type=int, default=50_000, help="Linhas buscadas por bloco do cursor")
+    parser.add_argument("--workers", type=int, default=4, help="Arquivos gravados em paralelo")
+    parser.add_argument("--forcar", action="store_true", help="Regera também os meses já atualizados")
+    parser.add_argument("--validar", action="store_true", help="Só confere o consolidado de pedidos de compra contra items")
+    args = parser.parse_args()
+
+    if args.validar:
+        raise SystemExit(1 if len(validate_purchase_orders(get_engine())) else 0)
+
     print("INICIANDO AUTOMAÇÃO DE RELATÓRIOS...")
-    dataframe = extract_data()
-    save_report(dataframe)
-    print("PROCESSO FINALIZADO...")
\ No newline at end of file
+    try:
+        run_batch(
+            args.inicio, args.fim or args.inicio, args.tipos, args.tarefas, args.status,
+            args.saida, args.formato, args.workers, args.chunksize, args.forcar
+        )
+    except Exception as e:
+        print(f"Erro ao gerar o relatório: {e}")
+    print("PROCESSO FINALIZADO...")
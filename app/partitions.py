@@ -0,0 +1,70 @@
+import argparse
+from datetime import datetime
+from sqlalchemy import text
+from db import get_engine
+
+# Manutenção das partições mensais de tasks (layout opcional de init_scripts/partitioned/)
+# python partitions.py status
+# python partitions.py criar --inicio 2026-01 --fim 2026-12
+# python partitions.py desanexar --mes 2024-01
+
+PARTITIONS_QUERY = """
+    SELECT
+        c.relname AS particao,
+        pg_get_expr(c.relpartbound, c.oid) AS limites,
+        c.reltuples::bigint AS linhas_estimadas,
+        pg_size_pretty(pg_total_relation_size(c.oid)) AS tamanho
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'tasks'::regclass
+    ORDER BY c.relname
+"""
+
+def is_partitioned(conn):
+    return conn.execute(text("SELECT relkind = 'p' FROM pg_class WHERE oid = 'tasks'::regclass")).scalar()
+
+def ensure_partitions(engine, inicio, fim):
+    """Cria as partições dos meses entre inicio e fim. Sem efeito se tasks não estiver particionada"""
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            return []
+        return conn.execute(
+            text("SELECT ensure_tasks_partitions(:inicio, :fim)"), {'inicio': inicio, 'fim': fim}
+        ).scalars().all()
+
+def detach_partition(engine, mes):
+    with engine.begin() as conn:
+        return conn.execute(text("SELECT detach_tasks_partition(:mes)"), {'mes': mes}).scalar()
+
+def list_partitions(engine):
+    with engine.connect() as conn:
+        return conn.execute(text(PARTITIONS_QUERY)).mappings().all()
+
+def month(texto):
+    return datetime.strptime(texto, '%Y-%m').date()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Partições mensais da tabela tasks")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    sub.add_parser("status", help="Lista as partições e o tamanho de cada uma")
+    criar = sub.add_parser("criar", help="Cria as partições de um intervalo de meses")
+    criar.add_argument("--inicio", type=month, required=True, help="Primeiro mês (YYYY-MM)")
+    criar.add_argument("--fim", type=month, required=True, help="Último mês, inclusive (YYYY-MM)")
+    desanexar = sub.add_parser("desanexar", help="Desanexa a partição de um mês (para arquivar ou remover)")
+    desanexar.add_argument("--mes", type=month, required=True, help="Mês da partição (YYYY-MM)")
+    args = parser.parse_args()
+
+    engine = get_engine()
+    with engine.connect() as conn:
+        if not is_partitioned(conn):
+            raise SystemExit("tasks não está particionada; aplique init_scripts/partitioned/01_tasks_by_month.sql")
+
+    if args.comando == "criar":
+        for nome in ensure_partitions(engine, args.inicio, args.fim):
+            print(f"   🗂️ {nome}")
+    elif args.comando == "desanexar":
+        nome = detach_partition(engine, args.mes)
+        print(f"Partição {nome} desanexada" if nome else "Partição inexistente")
+    else:
+        for p in list_partitions(engine):
+            print(f"{p['particao']:<20} {p['limites']:<70} {p['linhas_estimadas']:>12} {p['tamanho']:>10}")
@@ -0,0 +1,304 @@
+import time
+import contextvars
+import pandas as pd
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from enrichment import format_cnpj
+from aggregations import TOP_CITIES, OTHERS_LABEL, TIME_GRAINS, time_grain
+import instrumentation
+
+# Camada de consultas do dashboard: filtros aplicados no WHERE e agregações feitas no Postgres
+
+FROM_JOINS = """
+    FROM tax_documents td
+    INNER JOIN tasks t ON td.process_instance_id = t.process_instance_id
+    LEFT JOIN cities c ON td.supplier_city_id = c.id
+    LEFT JOIN states s ON c.state_id = s.id
+    INNER JOIN task_definitions td_def ON t.task_definition_id = td_def.id
+    INNER JOIN status st ON t.status_id = st.id
+"""
+
+# Dataset linha a linha do dashboard (modo pandas e exportação)
+DATA_QUERY = """
+    SELECT
+        td.id,
+        t.id AS task_id,
+        td.total_value,
+        td.type AS tipo_nota,
+        td_def.name AS nome_tarefa,
+        st.name AS status_tarefa,
+        td.supplier_identification_number AS cnpj_fornecedor,
+        c.name AS cidade_fornecedor,
+        s.name AS estado_fornecedor,
+        t.created_at,
+        t.completed_at
+""" + FROM_JOINS
+
+# Atualização incremental: tarefas concluídas depois do watermark (completed_at, id)
+# e tarefas ainda não carregadas (id acima do maior já visto), abertas ou concluídas em data anterior
+# (os geradores inserem tarefas já concluídas no passado); as abertas já carregadas voltam pelo
+# primeiro critério quando forem concluídas
+DELTA_WHERE = """
+    WHERE t.completed_at > :wm_completed_at
+       OR (t.completed_at = :wm_completed_at AND t.id > :wm_id)
+       OR t.id > :max_task_id
+"""
+
+# Coluna do dataset -> expressão SQL equivalente (filtros multiselect da barra lateral)
+FILTER_COLUMNS = {
+    'tipo_nota': 'td.type',
+    'nome_tarefa': 'td_def.name',
+    'status_tarefa': 'st.name',
+    'estado_fornecedor': 's.name',
+}
+
+LEAD_TIME_SQL = "EXTRACT(EPOCH FROM (t.completed_at - t.created_at)) / 3600"
+
+# Resumo diário pré-agregado (init_scripts/04_reporting_views.sql), com os mesmos aliases de dimensão
+FROM_RESUMO = """
+    FROM mv_resumo_diario r
+    LEFT JOIN cities c ON r.city_id = c.id
+    LEFT JOIN states s ON r.state_id = s.id
+    INNER JOIN task_definitions td_def ON r.task_definition_id = td_def.id
+    INNER JOIN status st ON r.status_id = st.id
+"""
+
+# Fontes das agregações: tabelas base (sempre atualizadas) ou resumo (atualizado no REFRESH)
+SOURCES = {
+    'base': {
+        'from': FROM_JOINS,
+        'periodo': 't.completed_at',
+        'tipo_nota': 'td.type',
+        'cnpj': 'td.supplier_identification_number',
+        'dia': 't.completed_at::date',
+        'qtd': 'COUNT(td.id)',
+        'valor': 'SUM(td.total_value)',
+        'lead_time_medio': f'AVG({LEAD_TIME_SQL})',
+    },
+    'resumo': {
+        'from': FROM_RESUMO,
+        'periodo': 'r.dia',
+        'tipo_nota': 'r.tipo_nota',
+        'cnpj': 'r.cnpj_fornecedor',
+        'dia': 'r.dia',
+        # SUM de nenhuma linha é NULL: filtro vazio precisa voltar 0, como o COUNT das tabelas base
+        'qtd': 'COALESCE(SUM(r.qtd_notas), 0)::bigint',
+        'valor': 'SUM(r.total_value)',
+        'lead_time_medio': 'SUM(r.soma_lead_time_horas) / NULLIF(SUM(r.qtd_lead_time), 0)',
+    },
+}
+
+def build_where(filtros, source='base'):
+    # filtros: {'periodo': (inicio, fim), 'tipo_nota': [...], 'nome_tarefa': [...], ...}
+    # O período é comparado direto na coluna (sem cast), para aproveitar índices
+    fonte = SOURCES[source]
+    inicio, fim = filtros['periodo']
+    condicoes = [f"{fonte['periodo']} >= :inicio", f"{fonte['periodo']} < :fim"]
+    params = {'inicio': inicio, 'fim': fim + timedelta(days=1)}
+
+    for coluna, expressao in FILTER_COLUMNS.items():
+        condicoes.append(f"{fonte.get(coluna, expressao)} = ANY(:{coluna})")
+        params[coluna] = list(filtros[coluna])
+
+    return "WHERE " + "\n        AND ".join(condicoes), params
+
+def _read(engine, sql, params=None, nome='consulta'):
+    # Tempo da consulta, linhas e memória do frame retornado (deep: inclui o conteúdo das strings,
+    # medido fora do tempo da consulta)
+    inicio = time.perf_counter()
+    df = pd.read_sql(text(sql), engine, params=params)
+    segundos = time.perf_counter() - inicio
+    instrumentation.record_sql(nome, segundos, len(df), df.memory_usage(index=False, deep=True).sum())
+    return df
+
+def get_full_data(engine):
+    return _read(engine, f"{DATA_QUERY} ORDER BY t.completed_at, t.id", nome='full_data')
+
+def get_delta(engine, watermark):
+    wm_completed_at, wm_id, max_task_id = watermark
+    return _read(
+        engine, f"{DATA_QUERY} {DELTA_WHERE} ORDER BY t.completed_at, t.id",
+        {'wm_completed_at': wm_completed_at, 'wm_id': wm_id, 'max_task_id': max_task_id}, nome='delta'
+    )
+
+def get_rows_by_task_ids(engine, task_ids):
+    # Estado atual das tarefas informadas (as removidas simplesmente não voltam)
+    return _read(engine, f"{DATA_QUERY} WHERE t.id = ANY(:ids)", {'ids': list(task_ids)}, nome='rows_by_task_ids')
+
+# Impressão digital de cada mês de tasks (usa o índice (completed_at, id)); 'pendente' = tarefas abertas
+MONTH_FINGERPRINT_QUERY = """
+    SELECT COALESCE(TO_CHAR(completed_at, 'YYYY-MM'), 'pendente') AS ano_mes, COUNT(*) AS linhas, MAX(id) AS max_id
+    FROM tasks
+    GROUP BY 1
+"""
+
+def get_month_fingerprints(engine):
+    df = _read(engine, MONTH_FINGERPRINT_QUERY, nome='month_fingerprints')
+    return {row.ano_mes: [int(row.linhas), int(row.max_id)] for row in df.itertuples()}
+
+def get_month_data(engine, ano_mes):
+    # Linhas de um único mês de completed_at (ou das tarefas abertas)
+    if ano_mes == 'pendente':
+        return _read(engine, f"{DATA_QUERY} WHERE t.completed_at IS NULL ORDER BY t.id", nome='month_data')
+    inicio = datetime.strptime(ano_mes, '%Y-%m')
+    fim = (inicio + timedelta(days=32)).replace(day=1)
+    return _read(
+        engine, f"{DATA_QUERY} WHERE t.completed_at >= :inicio AND t.completed_at < :fim ORDER BY t.completed_at, t.id",
+        {'inicio': inicio, 'fim': fim}, nome='month_data'
+    )
+
+# Carimbo da versão dos dados (PK e índice (completed_at, id)): muda a cada tarefa nova ou concluída
+DATA_VERSION_QUERY = "SELECT MAX(id) AS max_id, MAX(completed_at) AS max_completed_at FROM tasks"
+
+def get_data_version(engine):
+    df = _read(engine, DATA_VERSION_QUERY, nome='data_version')
+    return f"{df['max_id'].iloc[0]}|{df['max_completed_at'].iloc[0]}"
+
+def get_filter_options(engine):
+    # Valores disponíveis para os widgets, sem trazer o dataset
+    limites = _read(engine, "SELECT MIN(completed_at)::date AS inicio, MAX(completed_at)::date AS fim FROM tasks", nome='filter_options')
+    return {
+        'periodo': (limites['inicio'].iloc[0], limites['fim'].iloc[0]),
+        'tipo_nota': _read(engine, "SELECT DISTINCT type AS v FROM tax_documents WHERE type IS NOT NULL ORDER BY 1", nome='filter_options')['v'].tolist(),
+        'nome_tarefa': _read(engine, "SELECT name AS v FROM task_definitions ORDER BY id", nome='filter_options')['v'].tolist(),
+        'status_tarefa': _read(engine, "SELECT name AS v FROM status ORDER BY id", nome='filter_options')['v'].tolist(),
+        'estado_fornecedor': _read(engine, "SELECT name AS v FROM states ORDER BY id", nome='filter_options')['v'].tolist(),
+    }
+
+def get_rows(engine, filtros):
+    # Linhas filtradas (usado apenas na exportação)
+    where, params = build_where(filtros)
+    return _read(engine, f"{DATA_QUERY} {where} ORDER BY t.completed_at", params, nome='rows')
+
+def get_kpis(engine, filtros, source='base'):
+    fonte = SOURCES[source]
+    where, params = build_where(filtros, source)
+    df = _read(engine, f"""
+        SELECT
+            COALESCE({fonte['valor']}, 0) AS total_gasto,
+            {fonte['qtd']} AS qtd_notas,
+            COALESCE({fonte['lead_time_medio']}, 0) AS lead_time_medio,
+            COUNT(DISTINCT {fonte['cnpj']}) AS qtd_fornecedores
+        {fonte['from']} {where}
+    """, params, nome='kpis')
+    return df.iloc[0].to_dict()
+
+def get_pareto(engine, filtros, top=10, source='base'):
+    fonte = SOURCES[source]
+    where, params = build_where(filtros, source)
+    df = _read(engine, f"""
+        SELECT {fonte['cnpj']} AS cnpj_fornecedor, {fonte['valor']} AS total_value
+        {fonte['from']} {where}
+        GROUP BY 1
+        ORDER BY total_value DESC
+        LIMIT {int(top)}
+    """, params, nome='pareto')
+    df['cnpj_formatado'] = df['cnpj_fornecedor'].apply(format_cnpj)
+    return df
+
+def get_geo(engine, filtros, source='base', top=TOP_CITIES):
+    # Top N cidades por estado; as demais viram uma única linha "Outras" por estado
+    fonte = SOURCES[source]
+    where, params = build_where(filtros, source)
+    return _read(engine, f"""
+        WITH cidades AS (
+            SELECT
+                s.name AS estado_fornecedor, c.name AS cidade_fornecedor, {fonte['qtd']} AS volume_notas,
+                ROW_NUMBER() OVER (PARTITION BY s.name ORDER BY {fonte['qtd']} DESC, c.name) AS posicao
+            {fonte['from']} {where}
+            GROUP BY s.name, c.name
+        )
+        SELECT
+            estado_fornecedor,
+            CASE WHEN posicao <= {int(top)} THEN cidade_fornecedor ELSE '{OTHERS_LABEL}' END AS cidade_fornecedor,
+            SUM(volume_notas)::bigint AS volume_notas
+        FROM cidades
+        GROUP BY 1, 2
+    """, params, nome='geo')
+
+def get_lead_time_histogram(engine, filtros, nbins=20):
+    # Bins de largura fixa entre o menor e o maior lead time do filtro (equivalente a nbins do plotly)
+    where, params = build_where(filtros)
+    df = _read(engine, f"""
+        WITH base AS (
+            SELECT {LEAD_TIME_SQL} AS lead_time
+            {FROM_JOINS} {where}
+        ), limites AS (
+            SELECT MIN(lead_time) AS minimo, MAX(lead_time) AS maximo FROM base
+        )
+        SELECT
+            CASE WHEN l.maximo = l.minimo THEN 1
+                 ELSE LEAST(WIDTH_BUCKET(b.lead_time, l.minimo, l.maximo, {int(nbins)}), {int(nbins)})
+            END AS bin,
+            MIN(l.minimo) AS minimo, MIN(l.maximo) AS maximo, COUNT(*) AS contagem
+        FROM base b CROSS JOIN limites l
+        WHERE b.lead_time IS NOT NULL
+        GROUP BY 1
+        ORDER BY 1
+    """, params, nome='histograma')
+    return bins_frame(df, nbins)
+
+def bins_frame(df, nbins):
+    # Converte (bin, minimo, maximo, contagem) em intervalos [inicio, fim)
+    if df.empty:
+        return pd.DataFrame(columns=['inicio', 'fim', 'contagem'])
+    minimo, maximo = float(df['minimo'].iloc[0]), float(df['maximo'].iloc[0])
+    largura = (maximo - minimo) / nbins or 1.0
+    inicio = minimo + (df['bin'].astype(int) - 1) * largura
+    return pd.DataFrame({'inicio': inicio, 'fim': inicio + largura, 'contagem': df['contagem']})
+
+def get_daily_series(engine, filtros, source='base'):
+    # Dia, semana ou mês conforme o tamanho do período (ver aggregations.time_grain)
+    fonte = SOURCES[source]
+    where, params = build_where(filtros, source)
+    grao = time_grain(*filtros['periodo'])
+    df = _read(engine, f"""
+        SELECT DATE_TRUNC('{TIME_GRAINS[grao][1]}', {fonte['dia']})::date AS data_escrituracao, {fonte['qtd']} AS qtd_notas
+        {fonte['from']} {where}
+        GROUP BY 1
+        ORDER BY 1
+    """, params, nome='diario')
+    return df.assign(granularidade=grao)
+
+def aggregate_calls(source='base'):
+    # Agregação de cada gráfico -> (função, kwargs); todas recebem (engine, filtros)
+    # O histograma precisa do lead time de cada tarefa, então sempre usa as tabelas base
+    return {
+        'kpis': (get_kpis, {'source': source}),
+        'pareto': (get_pareto, {'source': source}),
+        'geo': (get_geo, {'source': source}),
+        'hist': (get_lead_time_histogram, {}),
+        'diario': (get_daily_series, {'source': source}),
+    }
+
+def iter_parallel(tarefas, executor=None):
+    """Executa {nome: função sem argumentos} em threads e devolve (nome, resultado) na ordem em que terminam"""
+    # Cada consulta usa sua própria conexão do pool; o contexto copiado mantém a instrumentação do rerun
+    proprio = executor is None
+    if proprio:
+        executor = ThreadPoolExecutor(max_workers=len(tarefas))
+    try:
+        futuros = {executor.submit(contextvars.copy_context().run, funcao): nome for nome, funcao in tarefas.items()}
+        for futuro in as_completed(futuros):
+            yield futuros[futuro], futuro.result()
+    finally:
+        if proprio:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+def fetch_aggregates(engine, filtros, source='base', executor=None):
+    # Mesmo formato de aggregations.compute_aggregates, calculado no banco com as consultas em paralelo
+    tarefas = {
+        nome: partial(funcao, engine, filtros, **kwargs)
+        for nome, (funcao, kwargs) in aggregate_calls(source).items()
+    }
+    return dict(iter_parallel(tarefas, executor))
+
+def refresh_reporting_views(engine):
+    # Atualiza o resumo diário sem bloquear leituras (ignora bancos sem a migração 04)
+    with engine.begin() as conn:
+        existe = conn.execute(text("SELECT to_regclass('mv_resumo_diario') IS NOT NULL")).scalar()
+        if existe:
+            conn.execute(text("REFRESH MATERIALIZED VIEW CONCURRENTLY mv_resumo_diario"))
+    return existe
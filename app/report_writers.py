@@ -0,0 +1,102 @@
+import gzip
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xlsxwriter
+from openpyxl import Workbook
+
+# Escrita em streaming: cada writer consome um iterável de DataFrames (chunks)
+# e grava linha a linha, sem montar o arquivo inteiro em memória
+
+# Limite de linhas por aba do Excel (inclui o cabeçalho)
+EXCEL_MAX_ROWS = 1_048_576
+
+def _rows(chunk):
+    # Valores nulos viram células vazias
+    return chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None)
+
+def write_xlsx(chunks, path, sheet_name='Relatório'):
+    # openpyxl em modo write-only; ao atingir o limite do Excel, abre uma nova aba
+    wb = Workbook(write_only=True)
+    ws = None
+    linhas_aba = 0
+    total = 0
+    abas = 0
+
+    for chunk in chunks:
+        for linha in _rows(chunk):
+            if ws is None or linhas_aba >= EXCEL_MAX_ROWS:
+                abas += 1
+                ws = wb.create_sheet(sheet_name if abas == 1 else f"{sheet_name} ({abas})")
+                ws.append(list(chunk.columns))
+                linhas_aba = 1
+            ws.append(list(linha))
+            linhas_aba += 1
+            total += 1
+
+    if ws is None:
+        wb.create_sheet(sheet_name)
+    wb.save(path)
+    return total
+
+def write_xlsx_constant_memory(chunks, path, sheet_name='Relatório'):
+    # xlsxwriter com constant_memory: cada linha é gravada direto no disco, bem mais rápido que o openpyxl
+    wb = xlsxwriter.Workbook(path, {
+        'constant_memory': True, 'default_date_format': 'yyyy-mm-dd hh:mm:ss', 'remove_timezone': True,
+    })
+    ws = None
+    linhas_aba = 0
+    total = 0
+    abas = 0
+
+    try:
+        for chunk in chunks:
+            for linha in _rows(chunk):
+                if ws is None or linhas_aba >= EXCEL_MAX_ROWS:
+                    abas += 1
+                    ws = wb.add_worksheet(sheet_name if abas == 1 else f"{sheet_name} ({abas})")
+                    ws.write_row(0, 0, list(chunk.columns))
+                    linhas_aba = 1
+                ws.write_row(linhas_aba, 0, linha)
+                linhas_aba += 1
+                total += 1
+
+        if ws is None:
+            wb.add_worksheet(sheet_name)
+    finally:
+        wb.close()
+    return total
+
+def write_csv_gz(chunks, path):
+    total = 0
+    with gzip.open(path, 'wt', encoding='utf-8', newline='') as f:
+        for chunk in chunks:
+            chunk.to_csv(f, index=False, header=(total == 0))
+            total += len(chunk)
+    return total
+
+def write_parquet(chunks, path):
+    writer = None
+    schema = None
+    total = 0
+    try:
+        for chunk in chunks:
+            if writer is None:
+                schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+                # Colunas totalmente nulas no primeiro bloco viram texto
+                for i, campo in enumerate(schema):
+                    if pa.types.is_null(campo.type):
+                        schema = schema.set(i, pa.field(campo.name, pa.string()))
+                writer = pq.ParquetWriter(path, schema)
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            total += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return total
+
+# formato -> (função, extensão do arquivo)
+WRITERS = {
+    'xlsx': (write_xlsx, 'xlsx'),
+    'csv.gz': (write_csv_gz, 'csv.gz'),
+    'parquet': (write_parquet, 'parquet'),
+}
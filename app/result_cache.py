@@ -0,0 +1,216 @@
+import json
+import time
+import pickle
+import sqlite3
+import hashlib
+import inspect
+import argparse
+import importlib
+import threading
+import instrumentation
+
+# Cache de resultados compartilhado entre processos (workers / réplicas do Streamlit na mesma máquina)
+# Um arquivo SQLite, sem serviço externo; o st.cache_data continua na frente, por processo
+# Chave: sha256(consulta normalizada + parâmetros + versão dos dados); nova versão = novas chaves
+# Os parâmetros levam a versão do código (code_version), então um deploy também gera novas chaves
+# LRU limitado pelo total de bytes; só um processo recalcula uma chave ausente (lease), os demais aguardam
+# Os valores são pickles: o arquivo deve ser gravável apenas pelo usuário do app
+# python result_cache.py .result_cache.sqlite [--limpar]
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS resultados (
+        chave TEXT PRIMARY KEY,
+        nome TEXT NOT NULL,
+        valor BLOB,              -- NULL enquanto o processo dono do lease calcula
+        bytes INTEGER NOT NULL DEFAULT 0,
+        usado_em REAL NOT NULL,
+        lease_ate REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_resultados_usado_em ON resultados (usado_em);
+    CREATE TABLE IF NOT EXISTS estatisticas (
+        nome TEXT PRIMARY KEY,
+        hits INTEGER NOT NULL DEFAULT 0,
+        misses INTEGER NOT NULL DEFAULT 0
+    );
+"""
+
+def new_cache(path, max_bytes, lease_seconds=300, espera=0.2):
+    # lease_seconds: após esse tempo sem resultado, outro processo assume o cálculo (dono travado ou encerrado)
+    cache = {
+        'path': path, 'max_bytes': max_bytes, 'lease_seconds': lease_seconds, 'espera': espera,
+        'local': threading.local(),
+    }
+    _connect(cache).executescript(SCHEMA)
+    return cache
+
+def _connect(cache):
+    # Uma conexão por thread; autocommit, com as transações abertas explicitamente
+    conn = getattr(cache['local'], 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(cache['path'], timeout=30, isolation_level=None)
+        # WAL: leituras não bloqueiam a escrita de outro processo
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        cache['local'].conn = conn
+    return conn
+
+def _normalize(valor):
+    # Listas/conjuntos (opções do multiselect) sem ordem; tuplas (período) mantêm a ordem
+    if isinstance(valor, dict):
+        return {str(k): _normalize(v) for k, v in sorted(valor.items(), key=lambda item: str(item[0]))}
+    if isinstance(valor, (list, set, frozenset)):
+        return sorted((_normalize(v) for v in valor), key=str)
+    if isinstance(valor, tuple):
+        return [_normalize(v) for v in valor]
+    return str(valor)
+
+def cache_key(consulta, params, versao):
+    # Espaços da consulta colapsados: a mesma SQL com indentação diferente gera a mesma chave
+    texto = json.dumps([' '.join(consulta.split()), _normalize(params), str(versao)])
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+def code_version(*modulos):
+    # Hash do código-fonte dos módulos que montam a consulta e o resultado (SQL, pós-processamento)
+    hash_codigo = hashlib.sha256()
+    for nome in modulos:
+        hash_codigo.update(inspect.getsource(importlib.import_module(nome)).encode('utf-8'))
+    return hash_codigo.hexdigest()[:16]
+
+def _transaction(conn, funcao):
+    # BEGIN IMMEDIATE: reserva a escrita já no início, então leitura e lease são atômicos entre processos
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        resultado = funcao()
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+    return resultado
+
+def _count(conn, nome, hits=0, misses=0):
+    conn.execute(
+        """INSERT INTO estatisticas (nome, hits, misses) VALUES (?, ?, ?)
+           ON CONFLICT(nome) DO UPDATE SET hits = hits + excluded.hits, misses = misses + excluded.misses""",
+        (nome, hits, misses)
+    )
+
+def _lookup(cache, chave, nome):
+    """('hit', bytes), ('lease', None) se este processo deve calcular, ou ('aguardar', None)"""
+    conn = _connect(cache)
+
+    def consultar():
+        agora = time.time()
+        linha = conn.execute("SELECT valor, lease_ate FROM resultados WHERE chave = ?", (chave,)).fetchone()
+        if linha is not None and linha[0] is not None:
+            conn.execute("UPDATE resultados SET usado_em = ? WHERE chave = ?", (agora, chave))
+            _count(conn, nome, hits=1)
+            return 'hit', linha[0]
+        if linha is not None and linha[1] is not None and linha[1] > agora:
+            return 'aguardar', None
+        conn.execute(
+            """INSERT INTO resultados (chave, nome, valor, bytes, usado_em, lease_ate) VALUES (?, ?, NULL, 0, ?, ?)
+               ON CONFLICT(chave) DO UPDATE SET lease_ate = excluded.lease_ate""",
+            (chave, nome, agora, agora + cache['lease_seconds'])
+        )
+        _count(conn, nome, misses=1)
+        return 'lease', None
+
+    return _transaction(conn, consultar)
+
+def _store(cache, chave, dados):
+    conn = _connect(cache)
+
+    def gravar():
+        # Maior que o limite inteiro ou que o maior BLOB aceito pelo SQLite: não é guardado (só libera o lease)
+        if len(dados) > min(cache['max_bytes'], conn.getlimit(sqlite3.SQLITE_LIMIT_LENGTH)):
+            conn.execute("DELETE FROM resultados WHERE chave = ?", (chave,))
+            return
+        conn.execute(
+            "UPDATE resultados SET valor = ?, bytes = ?, usado_em = ?, lease_ate = NULL WHERE chave = ?",
+            (dados, len(dados), time.time(), chave)
+        )
+        # Descarta os menos usados até caber; leases em andamento não ocupam espaço
+        total = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM resultados").fetchone()[0]
+        if total <= cache['max_bytes']:
+            return
+        antigos = conn.execute(
+            "SELECT chave, bytes FROM resultados WHERE valor IS NOT NULL AND chave <> ? ORDER BY usado_em", (chave,)
+        ).fetchall()
+        for antiga, tamanho in antigos:
+            if total <= cache['max_bytes']:
+                break
+            conn.execute("DELETE FROM resultados WHERE chave = ?", (antiga,))
+            total -= tamanho
+
+    _transaction(conn, gravar)
+
+def _release(cache, chave):
+    # Cálculo falhou: remove o lease para o próximo processo tentar de imediato
+    _connect(cache).execute("DELETE FROM resultados WHERE chave = ? AND valor IS NULL", (chave,))
+
+def get_or_compute(cache, nome, consulta, params, versao, calcular):
+    """Resultado de calcular() para (consulta, params, versao), calculado por um único processo por vez"""
+    # nome agrupa as estatísticas (ex.: 'agregacoes', 'full_data')
+    instrumentation.count('resultados.chamadas')
+    chave = cache_key(consulta, params, versao)
+    while True:
+        estado, dados = _lookup(cache, chave, nome)
+        if estado == 'hit':
+            return pickle.loads(dados)
+        if estado == 'lease':
+            break
+        # Outro processo está calculando a mesma chave
+        time.sleep(cache['espera'])
+
+    instrumentation.count('resultados.misses')
+    try:
+        resultado = calcular()
+    except BaseException:
+        _release(cache, chave)
+        raise
+    try:
+        _store(cache, chave, pickle.dumps(resultado, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception as e:
+        # Resultado não serializável ou recusado pelo SQLite: os outros processos não ficam esperando
+        # o lease vencer, e quem calculou recebe o resultado mesmo sem cache
+        print(f"⚠️ Cache de resultados: '{nome}' não foi guardado ({e.__class__.__name__}: {e})")
+        _release(cache, chave)
+    return resultado
+
+def stats(cache):
+    """Acertos de todos os processos por nome, mais ocupação do arquivo"""
+    conn = _connect(cache)
+    linhas = [
+        {
+            'nome': nome, 'hits': hits, 'misses': misses,
+            'hit_ratio': round(hits / (hits + misses), 3) if hits + misses else None,
+        }
+        for nome, hits, misses in conn.execute("SELECT nome, hits, misses FROM estatisticas ORDER BY nome")
+    ]
+    itens, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM resultados WHERE valor IS NOT NULL").fetchone()
+    return {'itens': itens, 'bytes': total, 'max_bytes': cache['max_bytes'], 'por_nome': linhas}
+
+def clear(cache):
+    conn = _connect(cache)
+
+    def limpar():
+        conn.execute("DELETE FROM resultados")
+        conn.execute("DELETE FROM estatisticas")
+
+    _transaction(conn, limpar)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estatísticas do cache de resultados compartilhado do dashboard")
+    parser.add_argument("path", help="Arquivo SQLite (DASHBOARD_RESULT_CACHE)")
+    parser.add_argument("--limpar", action="store_true", help="Remove todos os resultados e estatísticas")
+    args = parser.parse_args()
+
+    cache = new_cache(args.path, max_bytes=0)
+    if args.limpar:
+        clear(cache)
+        print("Cache limpo")
+    else:
+        resumo = stats(cache)
+        print(f"{resumo['itens']} resultados, {resumo['bytes'] / 2**20:.1f} MB")
+        for linha in resumo['por_nome']:
+            print(f"   {linha['nome']:<15} hits={linha['hits']:<8} misses={linha['misses']:<8} hit_ratio={linha['hit_ratio']}")
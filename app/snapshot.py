@@ -0,0 +1,88 @@
+import os
+import json
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import queries
+from enrichment import enrich, compact_dtypes
+
+# Snapshot local do dataset enriquecido do dashboard em Parquet particionado (ano_mes / tipo_nota)
+# Cada mês guarda a impressão digital (linhas, max id) de tasks do momento em que foi gravado;
+# só os meses ausentes ou com impressão diferente voltam a ser buscados no banco
+
+# Prefixo '_': o pyarrow ignora o arquivo ao descobrir as partições
+MANIFEST = '_manifest.json'
+PARTITION_COLS = ['ano_mes', 'tipo_nota']
+
+def _manifest_path(path):
+    return os.path.join(path, MANIFEST)
+
+def read_manifest(path):
+    try:
+        with open(_manifest_path(path), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def write_manifest(path, manifest):
+    # Grava em arquivo temporário e troca, para leitores nunca verem um JSON pela metade
+    tmp = _manifest_path(path) + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp, _manifest_path(path))
+
+def write_month(path, ano_mes, df):
+    # Substitui todas as partições do mês (um diretório por tipo de nota)
+    diretorio = os.path.join(path, f"ano_mes={ano_mes}")
+    shutil.rmtree(diretorio, ignore_errors=True)
+    if df.empty:
+        return
+    tabela = pa.Table.from_pandas(df.assign(ano_mes=ano_mes), preserve_index=False)
+    pq.write_to_dataset(tabela, path, partition_cols=PARTITION_COLS)
+
+def read_snapshot(path, meses=None, tipos=None):
+    # Leitura com memory map; os filtros de partição descartam diretórios sem abrir arquivos
+    if (meses is not None and not meses) or (tipos is not None and not tipos):
+        return None
+    filtros = []
+    if meses is not None:
+        filtros.append(('ano_mes', 'in', list(meses)))
+    if tipos is not None:
+        filtros.append(('tipo_nota', 'in', list(tipos)))
+
+    tabela = pq.read_table(path, filters=filtros or None, memory_map=True)
+    return tabela.to_pandas().drop(columns=['ano_mes'])
+
+def load_snapshot(engine, path):
+    """Carrega o dataset do snapshot, atualizando antes os meses ausentes ou desatualizados"""
+    os.makedirs(path, exist_ok=True)
+    manifest = read_manifest(path)
+    gravados = manifest.get('meses', {})
+    atuais = queries.get_month_fingerprints(engine)
+
+    validos = [mes for mes, digital in atuais.items() if gravados.get(mes) == digital]
+    desatualizados = [mes for mes in atuais if mes not in validos]
+
+    # Meses que sumiram do banco saem do snapshot
+    for mes in set(gravados) - set(atuais):
+        shutil.rmtree(os.path.join(path, f"ano_mes={mes}"), ignore_errors=True)
+
+    partes = []
+    if validos:
+        partes.append(read_snapshot(path, meses=validos))
+
+    for mes in desatualizados:
+        df_mes = enrich(queries.get_month_data(engine, mes))
+        write_month(path, mes, df_mes)
+        partes.append(df_mes)
+
+    write_manifest(path, {'meses': {mes: atuais[mes] for mes in atuais}})
+
+    partes = [parte for parte in partes if parte is not None and not parte.empty]
+    if not partes:
+        return enrich(queries.get_full_data(engine))
+
+    df = pd.concat(partes, ignore_index=True)
+    df = df.sort_values(['completed_at', 'task_id'], na_position='last', ignore_index=True)
+    return compact_dtypes(df)
@@ -0,0 +1,36 @@
+-- Índices para os JOINs e filtros do relatório (main.py) e do dashboard
+-- Idempotente: também pode ser aplicado como migração em um banco já existente
+
+-- JOIN tasks -> tax_documents pela instância de processo
+CREATE INDEX IF NOT EXISTS idx_tasks_process_instance_id
+    ON tasks (process_instance_id);
+
+CREATE INDEX IF NOT EXISTS idx_tax_documents_process_instance_id
+    ON tax_documents (process_instance_id);
+
+-- Filtro do relatório (tarefa 12, status 120, mês de completed_at); cobre o JOIN e o lead time
+CREATE INDEX IF NOT EXISTS idx_tasks_definition_status_completed_at
+    ON tasks (task_definition_id, status_id, completed_at)
+    INCLUDE (process_instance_id, created_at);
+
+-- Período do dashboard e watermark da atualização incremental (completed_at, id)
+CREATE INDEX IF NOT EXISTS idx_tasks_completed_at_id
+    ON tasks (completed_at, id);
+
+-- Filtro por tipo de nota ('MaterialInvoice', ...)
+CREATE INDEX IF NOT EXISTS idx_tax_documents_type
+    ON tax_documents (type)
+    INCLUDE (process_instance_id);
+
+-- LEFT JOIN items para o STRING_AGG dos pedidos de compra (index-only scan)
+CREATE INDEX IF NOT EXISTS idx_items_tax_document_id
+    ON items (tax_document_id)
+    INCLUDE (purchase_order);
+
+CREATE INDEX IF NOT EXISTS idx_cities_state_id
+    ON cities (state_id);
+
+ANALYZE tasks;
+ANALYZE tax_documents;
+ANALYZE items;
+ANALYZE cities;
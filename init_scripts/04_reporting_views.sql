@@ -0,0 +1,29 @@
+-- Resumo diário pré-agregado para o dashboard (dia x tipo x tarefa x status x fornecedor x cidade)
+-- Atualizado com: REFRESH MATERIALIZED VIEW CONCURRENTLY mv_resumo_diario;
+-- (os geradores de dados executam o refresh ao final de cada carga)
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_resumo_diario AS
+SELECT
+    t.completed_at::date AS dia,
+    td.type AS tipo_nota,
+    t.task_definition_id,
+    t.status_id,
+    td.supplier_identification_number AS cnpj_fornecedor,
+    c.state_id,
+    td.supplier_city_id AS city_id,
+    COUNT(*) AS qtd_notas,
+    SUM(td.total_value) AS total_value,
+    SUM(EXTRACT(EPOCH FROM (t.completed_at - t.created_at)) / 3600) AS soma_lead_time_horas,
+    COUNT(t.completed_at - t.created_at) AS qtd_lead_time
+FROM tax_documents td
+INNER JOIN tasks t ON td.process_instance_id = t.process_instance_id
+LEFT JOIN cities c ON td.supplier_city_id = c.id
+GROUP BY 1, 2, 3, 4, 5, 6, 7;
+
+-- Índice único exigido pelo REFRESH ... CONCURRENTLY (as chaves podem ser nulas)
+CREATE UNIQUE INDEX IF NOT EXISTS ux_mv_resumo_diario
+    ON mv_resumo_diario (dia, tipo_nota, task_definition_id, status_id, cnpj_fornecedor, state_id, city_id)
+    NULLS NOT DISTINCT;
+
+CREATE INDEX IF NOT EXISTS idx_mv_resumo_diario_tipo_dia
+    ON mv_resumo_diario (tipo_nota, dia);
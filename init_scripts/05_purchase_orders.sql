@@ -0,0 +1,83 @@
+-- Pedidos de compra consolidados por nota (o que o relatório mensal montava com STRING_AGG sobre items)
+-- Mantido por triggers de instrução em items: cada INSERT/UPDATE/DELETE/COPY recalcula só as notas afetadas
+-- Validação contra items: python main.py --validar
+
+CREATE TABLE IF NOT EXISTS tax_document_purchase_orders (
+    tax_document_id BIGINT PRIMARY KEY REFERENCES tax_documents(id) ON DELETE CASCADE,
+    purchase_orders TEXT
+);
+
+-- Recalcula o consolidado das notas informadas (mesma expressão do relatório original)
+CREATE OR REPLACE FUNCTION refresh_purchase_orders(ids BIGINT[]) RETURNS void AS $$
+    INSERT INTO tax_document_purchase_orders (tax_document_id, purchase_orders)
+    SELECT i.tax_document_id, STRING_AGG(DISTINCT i.purchase_order, ', ')
+    FROM items i
+    WHERE i.tax_document_id = ANY(ids)
+    GROUP BY i.tax_document_id
+    ON CONFLICT (tax_document_id) DO UPDATE SET purchase_orders = EXCLUDED.purchase_orders;
+
+    -- Notas que ficaram sem itens
+    DELETE FROM tax_document_purchase_orders p
+    WHERE p.tax_document_id = ANY(ids)
+      AND NOT EXISTS (SELECT 1 FROM items i WHERE i.tax_document_id = p.tax_document_id);
+$$ LANGUAGE sql;
+
+-- Uma execução por instrução, com as linhas alteradas nas tabelas de transição (novas / antigas)
+CREATE OR REPLACE FUNCTION trg_items_purchase_orders() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM refresh_purchase_orders(ARRAY(SELECT DISTINCT tax_document_id FROM novas WHERE tax_document_id IS NOT NULL));
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM refresh_purchase_orders(ARRAY(SELECT DISTINCT tax_document_id FROM antigas WHERE tax_document_id IS NOT NULL));
+    ELSE
+        -- Cobre a troca de nota (tax_document_id) e a alteração do pedido de compra
+        PERFORM refresh_purchase_orders(ARRAY(
+            SELECT tax_document_id FROM novas WHERE tax_document_id IS NOT NULL
+            UNION
+            SELECT tax_document_id FROM antigas WHERE tax_document_id IS NOT NULL
+        ));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trg_items_purchase_orders_truncate() RETURNS trigger AS $$
+BEGIN
+    TRUNCATE tax_document_purchase_orders;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Tabelas de transição exigem um trigger por evento
+DROP TRIGGER IF EXISTS items_purchase_orders_insert ON items;
+CREATE TRIGGER items_purchase_orders_insert
+    AFTER INSERT ON items
+    REFERENCING NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_items_purchase_orders();
+
+DROP TRIGGER IF EXISTS items_purchase_orders_update ON items;
+CREATE TRIGGER items_purchase_orders_update
+    AFTER UPDATE ON items
+    REFERENCING OLD TABLE AS antigas NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_items_purchase_orders();
+
+DROP TRIGGER IF EXISTS items_purchase_orders_delete ON items;
+CREATE TRIGGER items_purchase_orders_delete
+    AFTER DELETE ON items
+    REFERENCING OLD TABLE AS antigas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_items_purchase_orders();
+
+DROP TRIGGER IF EXISTS items_purchase_orders_truncate ON items;
+CREATE TRIGGER items_purchase_orders_truncate
+    AFTER TRUNCATE ON items
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_items_purchase_orders_truncate();
+
+-- Carga inicial a partir dos itens já existentes
+INSERT INTO tax_document_purchase_orders (tax_document_id, purchase_orders)
+SELECT tax_document_id, STRING_AGG(DISTINCT purchase_order, ', ')
+FROM items
+WHERE tax_document_id IS NOT NULL
+GROUP BY tax_document_id
+ON CONFLICT (tax_document_id) DO UPDATE SET purchase_orders = EXCLUDED.purchase_orders;
+
+ANALYZE tax_document_purchase_orders;
@@ -0,0 +1,87 @@
+-- Eventos de alteração (CDC) para o agregador do dashboard (app/aggregator.py)
+-- Cada instrução em tasks / tax_documents publica, via NOTIFY no canal dashboard_changes,
+-- os IDs das tarefas afetadas: {"origem": "tasks", "operacao": "INSERT", "task_ids": [...]}
+-- As mensagens só são entregues no COMMIT; o agregador relê essas tarefas e ajusta o cubo
+-- Vale para qualquer escritor, inclusive as cargas via COPY dos geradores
+
+-- IDs em lotes: o payload do NOTIFY é limitado a 8000 bytes
+CREATE OR REPLACE FUNCTION notify_task_changes(ids BIGINT[], origem TEXT, operacao TEXT) RETURNS void AS $$
+DECLARE
+    lote CONSTANT INT := 300;
+    total INT := COALESCE(array_length(ids, 1), 0);
+    i INT := 1;
+BEGIN
+    WHILE i <= total LOOP
+        PERFORM pg_notify('dashboard_changes', json_build_object(
+            'origem', origem, 'operacao', operacao, 'task_ids', ids[i:i + lote - 1]
+        )::text);
+        i := i + lote;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trg_tasks_changes() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM notify_task_changes(ARRAY(SELECT id FROM novas), 'tasks', TG_OP);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM notify_task_changes(ARRAY(SELECT id FROM antigas), 'tasks', TG_OP);
+    ELSE
+        PERFORM notify_task_changes(ARRAY(SELECT id FROM novas UNION SELECT id FROM antigas), 'tasks', TG_OP);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Mudanças na nota (valor, tipo, fornecedor...) afetam as tarefas do mesmo processo
+CREATE OR REPLACE FUNCTION trg_tax_documents_changes() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM notify_task_changes(ARRAY(
+            SELECT t.id FROM tasks t JOIN novas n ON t.process_instance_id = n.process_instance_id
+        ), 'tax_documents', TG_OP);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM notify_task_changes(ARRAY(
+            SELECT t.id FROM tasks t JOIN antigas a ON t.process_instance_id = a.process_instance_id
+        ), 'tax_documents', TG_OP);
+    ELSE
+        PERFORM notify_task_changes(ARRAY(
+            SELECT t.id FROM tasks t JOIN novas n ON t.process_instance_id = n.process_instance_id
+            UNION
+            SELECT t.id FROM tasks t JOIN antigas a ON t.process_instance_id = a.process_instance_id
+        ), 'tax_documents', TG_OP);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Tabelas de transição exigem um trigger por evento
+DROP TRIGGER IF EXISTS tasks_changes_insert ON tasks;
+CREATE TRIGGER tasks_changes_insert
+    AFTER INSERT ON tasks REFERENCING NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_tasks_changes();
+
+DROP TRIGGER IF EXISTS tasks_changes_update ON tasks;
+CREATE TRIGGER tasks_changes_update
+    AFTER UPDATE ON tasks REFERENCING OLD TABLE AS antigas NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_tasks_changes();
+
+DROP TRIGGER IF EXISTS tasks_changes_delete ON tasks;
+CREATE TRIGGER tasks_changes_delete
+    AFTER DELETE ON tasks REFERENCING OLD TABLE AS antigas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_tasks_changes();
+
+DROP TRIGGER IF EXISTS tax_documents_changes_insert ON tax_documents;
+CREATE TRIGGER tax_documents_changes_insert
+    AFTER INSERT ON tax_documents REFERENCING NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_tax_documents_changes();
+
+DROP TRIGGER IF EXISTS tax_documents_changes_update ON tax_documents;
+CREATE TRIGGER tax_documents_changes_update
+    AFTER UPDATE ON tax_documents REFERENCING OLD TABLE AS antigas NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_tax_documents_changes();
+
+DROP TRIGGER IF EXISTS tax_documents_changes_delete ON tax_documents;
+CREATE TRIGGER tax_documents_changes_delete
+    AFTER DELETE ON tax_documents REFERENCING OLD TABLE AS antigas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_tax_documents_changes();
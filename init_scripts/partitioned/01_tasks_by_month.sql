@@ -0,0 +1,117 @@
+-- Layout opcional: tasks particionada por mês de completed_at (RANGE)
+-- Não roda na inicialização do Docker (subdiretório); aplicar em um banco já criado:
+--   psql -U case_user -d case_analytics -f init_scripts/partitioned/01_tasks_by_month.sql
+--
+-- * Tarefas abertas (completed_at nulo) e meses sem partição ficam na partição DEFAULT
+-- * A chave primária teria de incluir completed_at, que é nulo nas tarefas abertas; por isso o id
+--   passa a ter apenas um índice comum (os geradores já garantem IDs disjuntos)
+-- * tax_documents não tem coluna de data própria (a data vem da tarefa) e continua sem partições
+-- * Os filtros por completed_at com limites constantes/parâmetros (relatório mensal, período do
+--   dashboard) eliminam as partições fora do intervalo ("Subplans Removed" no EXPLAIN)
+
+BEGIN;
+
+-- A materialized view depende de tasks; é recriada no fim
+DROP MATERIALIZED VIEW IF EXISTS mv_resumo_diario;
+
+CREATE TABLE tasks_partitioned (
+    id BIGINT NOT NULL,
+    created_at TIMESTAMP,
+    completed_at TIMESTAMP,
+    task_definition_id BIGINT REFERENCES task_definitions(id),
+    status_id BIGINT REFERENCES status(id),
+    assing_to_id BIGINT REFERENCES users(id),
+    completed_by_id BIGINT REFERENCES users(id),
+    process_instance_id BIGINT REFERENCES process_instances(id)
+) PARTITION BY RANGE (completed_at);
+
+CREATE TABLE tasks_default PARTITION OF tasks_partitioned DEFAULT;
+
+-- Uma partição por mês já existente nos dados
+DO $$
+DECLARE
+    mes DATE;
+BEGIN
+    FOR mes IN
+        SELECT generate_series(DATE_TRUNC('month', MIN(completed_at)), DATE_TRUNC('month', MAX(completed_at)), INTERVAL '1 month')::date
+        FROM tasks
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF tasks_partitioned FOR VALUES FROM (%L) TO (%L)',
+            'tasks_p' || to_char(mes, 'YYYY_MM'), mes, (mes + INTERVAL '1 month')::date
+        );
+    END LOOP;
+END $$;
+
+INSERT INTO tasks_partitioned
+SELECT id, created_at, completed_at, task_definition_id, status_id, assing_to_id, completed_by_id, process_instance_id
+FROM tasks;
+
+DROP TABLE tasks;
+ALTER TABLE tasks_partitioned RENAME TO tasks;
+
+-- Índices de 03_indexes.sql, criados no pai e propagados para cada partição
+CREATE INDEX IF NOT EXISTS idx_tasks_id ON tasks (id);
+CREATE INDEX IF NOT EXISTS idx_tasks_process_instance_id ON tasks (process_instance_id);
+CREATE INDEX IF NOT EXISTS idx_tasks_definition_status_completed_at
+    ON tasks (task_definition_id, status_id, completed_at)
+    INCLUDE (process_instance_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_tasks_completed_at_id ON tasks (completed_at, id);
+
+-- Nome da partição de um mês
+CREATE OR REPLACE FUNCTION tasks_partition_name(mes DATE) RETURNS TEXT AS $$
+    SELECT 'tasks_p' || to_char(DATE_TRUNC('month', mes), 'YYYY_MM');
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Cria a partição do mês (se ainda não existir), movendo antes as linhas desse mês que estejam na DEFAULT
+CREATE OR REPLACE FUNCTION create_tasks_partition(mes DATE) RETURNS TEXT AS $$
+DECLARE
+    inicio DATE := DATE_TRUNC('month', mes);
+    fim DATE := (DATE_TRUNC('month', mes) + INTERVAL '1 month')::date;
+    nome TEXT := tasks_partition_name(mes);
+BEGIN
+    IF to_regclass(nome) IS NOT NULL THEN
+        RETURN nome;
+    END IF;
+
+    EXECUTE format('CREATE TABLE %I (LIKE tasks INCLUDING DEFAULTS)', nome);
+    EXECUTE format(
+        'WITH movidas AS (DELETE FROM tasks_default WHERE completed_at >= %L AND completed_at < %L RETURNING *)
+         INSERT INTO %I SELECT * FROM movidas',
+        inicio, fim, nome
+    );
+    EXECUTE format('ALTER TABLE tasks ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', nome, inicio, fim);
+    RETURN nome;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Garante as partições de todos os meses entre inicio e fim (inclusive)
+CREATE OR REPLACE FUNCTION ensure_tasks_partitions(inicio DATE, fim DATE) RETURNS SETOF TEXT AS $$
+    SELECT create_tasks_partition(mes::date)
+    FROM generate_series(DATE_TRUNC('month', inicio), DATE_TRUNC('month', fim), INTERVAL '1 month') AS mes;
+$$ LANGUAGE sql;
+
+-- Desanexa a partição do mês (a tabela continua existindo para arquivamento ou DROP)
+CREATE OR REPLACE FUNCTION detach_tasks_partition(mes DATE) RETURNS TEXT AS $$
+DECLARE
+    nome TEXT := tasks_partition_name(mes);
+BEGIN
+    IF to_regclass(nome) IS NULL THEN
+        RETURN NULL;
+    END IF;
+    EXECUTE format('ALTER TABLE tasks DETACH PARTITION %I', nome);
+    RETURN nome;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Meses correntes e os próximos três
+SELECT ensure_tasks_partitions(CURRENT_DATE, (CURRENT_DATE + INTERVAL '3 months')::date);
+
+COMMIT;
+
+\ir ../04_reporting_views.sql
+
+-- Triggers de eventos (CDC) de tasks, removidos junto com a tabela antiga
+\ir ../06_change_events.sql
+
+ANALYZE tasks;
@@ -0,0 +1,27 @@
+import importlib
+import pandas as pd
+import pytest
+
+@pytest.fixture(scope='module')
+def dashboard():
+    # Importar o app executa a página em modo "bare" (sem servidor Streamlit); o backend aponta para
+    # um agregador inexistente, então a carga falha rápido e cai no st.error da página
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv('DASHBOARD_BACKEND', 'aggregator')
+        mp.setenv('DASHBOARD_AGGREGATOR_URL', 'http://127.0.0.1:9')
+        yield importlib.import_module('dashboard')
+
+def test_render_geo_with_categorical_columns(dashboard, monkeypatch):
+    # Formato do cubo / modo pandas: estado e cidade como category sem ordem
+    geo = pd.DataFrame({
+        'estado_fornecedor': pd.Categorical(['SP', 'SP', 'MG']),
+        'cidade_fornecedor': pd.Categorical(['Campinas', 'Outras', 'Uberlândia']),
+        'volume_notas': [3, 2, 1],
+    })
+    figuras = []
+    monkeypatch.setattr(dashboard.st, 'plotly_chart', lambda fig, **kwargs: figuras.append(fig))
+
+    dashboard.render_geo(dashboard.st.container(), {'geo': geo})
+
+    assert len(figuras) == 1
+    assert set(figuras[0].data[0].labels) == {'SP', 'MG', 'Campinas', 'Outras', 'Uberlândia'}
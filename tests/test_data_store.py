@@ -0,0 +1,71 @@
+import pandas as pd
+import data_store
+import queries
+from cube import build_cube
+from enrichment import enrich
+
+def raw_rows(*tarefas):
+    # (task_id, created_at, completed_at) -> linhas no formato de queries.DATA_QUERY
+    return pd.DataFrame([
+        {
+            'id': task_id * 10, 'task_id': task_id, 'total_value': 100.0 * task_id, 'tipo_nota': 'NFe',
+            'nome_tarefa': 'Escrituração', 'status_tarefa': 'Concluída' if completed_at else 'Pendente',
+            'cnpj_fornecedor': '12345678000190', 'cidade_fornecedor': 'Campinas', 'estado_fornecedor': 'SP',
+            'created_at': pd.Timestamp(created_at),
+            'completed_at': pd.Timestamp(completed_at) if completed_at else pd.NaT,
+        }
+        for task_id, created_at, completed_at in tarefas
+    ])
+
+BASE = raw_rows(
+    (1, '2024-01-01', '2024-01-05'),
+    (2, '2024-01-02', '2024-01-10'),
+    (3, '2024-01-03', '2024-01-20'),
+    (4, '2024-01-04', None),
+)
+
+# Tarefa nova (id acima do maior carregado) já concluída antes do watermark, como as dos geradores
+RETROATIVA = raw_rows((5, '2024-01-01', '2024-01-08'))
+
+def loaded_store():
+    store = data_store.new_store()
+    data_store.set_data(store, enrich(BASE.copy()))
+    store['atualizado_em'] = 0
+    return store
+
+def test_merge_delta_backdated_new_task():
+    store = loaded_store()
+    df = data_store.merge_delta(store['df'], enrich(RETROATIVA.copy()), store['watermark'])
+    assert df['task_id'].tolist() == [1, 5, 2, 3, 4]
+
+def test_refresh_loads_backdated_new_task(monkeypatch):
+    store = loaded_store()
+    assert store['watermark'][1:] == (3, 4)
+
+    def fake_delta(engine, watermark):
+        # Mesmo critério de queries.DELTA_WHERE sobre o "banco" (base + tarefa nova)
+        wm_completed_at, wm_id, max_task_id = watermark
+        banco = pd.concat([BASE, RETROATIVA], ignore_index=True)
+        completed_at = banco['completed_at']
+        filtro = (
+            (completed_at > wm_completed_at)
+            | ((completed_at == wm_completed_at) & (banco['task_id'] > wm_id))
+            | (banco['task_id'] > max_task_id)
+        )
+        return banco[filtro].reset_index(drop=True)
+    monkeypatch.setattr(queries, 'get_delta', fake_delta)
+
+    assert data_store.refresh(None, store) == 1
+    assert store['df']['task_id'].tolist() == [1, 5, 2, 3, 4]
+    assert store['watermark'][1:] == (3, 5)
+    # Cubo ajustado pelo delta igual ao reconstruído do frame inteiro
+    pd.testing.assert_frame_equal(
+        store['cubo']['linhas'].reset_index(drop=True),
+        build_cube(store['df'])['linhas'].reset_index(drop=True),
+        check_dtype=False, check_categorical=False,
+    )
+
+    # Nada mudou no banco: o mesmo delta não gera nova versão
+    versao = store['versao']
+    assert data_store.refresh(None, store) == 0
+    assert store['versao'] == versao
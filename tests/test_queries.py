@@ -0,0 +1,103 @@
+from datetime import date
+import pytest
+from sqlalchemy.exc import OperationalError, ProgrammingError
+import queries
+import instrumentation
+from db import get_engine
+
+# Filtro que não encontra nada: nenhum tipo de nota selecionado
+FILTRO_VAZIO = {
+    'periodo': (date(2000, 1, 1), date(2000, 1, 31)),
+    'tipo_nota': [],
+    'nome_tarefa': [],
+    'status_tarefa': [],
+    'estado_fornecedor': [],
+}
+
+class Null:
+    # NULL do SQL: qualquer operação com NULL resulta em NULL
+    def _null(self, *args):
+        return self
+    __add__ = __radd__ = __sub__ = __rsub__ = __mul__ = __rmul__ = __truediv__ = __rtruediv__ = _null
+
+NULL = Null()
+
+# Valor de cada agregação sobre zero linhas, como no Postgres
+AGGREGATES_ON_EMPTY = {'COUNT': '0', 'SUM': 'NULL', 'AVG': 'NULL', 'MIN': 'NULL', 'MAX': 'NULL'}
+
+def split_top_level(texto, separador):
+    # Divide em `separador` fora de parênteses (EXTRACT(EPOCH FROM ...) não encerra o SELECT)
+    partes, profundidade, inicio = [], 0, 0
+    for i, caractere in enumerate(texto):
+        profundidade += {'(': 1, ')': -1}.get(caractere, 0)
+        if profundidade == 0 and texto.startswith(separador, i):
+            partes.append(texto[inicio:i])
+            inicio = i + len(separador)
+    return partes + [texto[inicio:]]
+
+def eval_on_empty(expressao):
+    # Troca cada agregação pelo seu valor sem linhas (os argumentos nunca são avaliados) e avalia o resto
+    for nome, valor in AGGREGATES_ON_EMPTY.items():
+        while f"{nome}(" in expressao:
+            inicio = expressao.index(f"{nome}(")
+            fim, profundidade = inicio + len(nome), 0
+            for fim in range(inicio + len(nome), len(expressao)):
+                profundidade += {'(': 1, ')': -1}.get(expressao[fim], 0)
+                if profundidade == 0:
+                    break
+            expressao = expressao[:inicio] + valor + expressao[fim + 1:]
+    funcoes = {
+        'NULL': NULL,
+        'COALESCE': lambda *valores: next((v for v in valores if v is not NULL), NULL),
+        'NULLIF': lambda a, b: NULL if a == b else a,
+    }
+    valor = eval(expressao.replace('::bigint', ''), funcoes)
+    return None if valor is NULL else valor
+
+def empty_result_read(engine, sql, params=None, nome='consulta'):
+    # Conexão falsa: devolve a linha que o Postgres retornaria para um SELECT de agregações sem linhas
+    select = split_top_level(' '.join(sql.split()).removeprefix('SELECT '), ' FROM ')[0]
+    linha = {}
+    for coluna in split_top_level(select, ', '):
+        expressao, alias = coluna.rsplit(' AS ', 1)
+        linha[alias] = eval_on_empty(expressao)
+    return queries.pd.DataFrame([linha])
+
+@pytest.mark.parametrize('source', ['base', 'resumo'])
+def test_kpis_empty_filter_returns_zeros(monkeypatch, source):
+    # O dashboard testa qtd_notas == 0 para mostrar "sem dados"; NULL/NaN quebraria a formatação dos KPIs
+    monkeypatch.setattr(queries, '_read', empty_result_read)
+    kpis = queries.get_kpis(None, FILTRO_VAZIO, source=source)
+    assert kpis == {'total_gasto': 0, 'qtd_notas': 0, 'lead_time_medio': 0, 'qtd_fornecedores': 0}
+    assert not any(queries.pd.isna(valor) for valor in kpis.values())
+
+@pytest.fixture(scope='module')
+def engine():
+    # Banco do docker-compose (variáveis DB_* / app/.env); sem ele o teste é pulado
+    try:
+        engine = get_engine()
+        with engine.connect() as conn:
+            conn.exec_driver_sql("SELECT 1 FROM mv_resumo_diario LIMIT 1")
+    except (OperationalError, ProgrammingError, ValueError) as e:
+        pytest.skip(f"banco com mv_resumo_diario indisponível: {e.__class__.__name__}")
+    return engine
+
+@pytest.mark.parametrize('source', ['base', 'resumo'])
+def test_kpis_empty_filter_database(engine, source):
+    kpis = queries.get_kpis(engine, FILTRO_VAZIO, source=source)
+    assert kpis['qtd_notas'] == 0
+    assert kpis['total_gasto'] == 0
+    assert kpis['lead_time_medio'] == 0
+    assert kpis['qtd_fornecedores'] == 0
+
+def test_read_records_dataframe_bytes_with_strings(monkeypatch):
+    # Strings longas: sem deep=True, cada valor contaria só os 8 bytes do ponteiro
+    df = queries.pd.DataFrame({'cidade_fornecedor': ['x' * 1000] * 10})
+    monkeypatch.setattr(queries.pd, 'read_sql', lambda sql, engine, params=None: df)
+    execucao = instrumentation.start_run('teste')
+    try:
+        queries._read(None, "SELECT 1", nome='teste')
+    finally:
+        instrumentation.finish_run()
+    assert execucao['sql'][0]['bytes_dataframe'] == df.memory_usage(index=False, deep=True).sum()
+    assert execucao['sql'][0]['bytes_dataframe'] > 10_000
@@ -0,0 +1,28 @@
+import sqlite3
+import threading
+import result_cache
+
+def pending_leases(cache):
+    return result_cache._connect(cache).execute("SELECT COUNT(*) FROM resultados WHERE valor IS NULL").fetchone()[0]
+
+def test_store_failure_releases_lease(tmp_path):
+    cache = result_cache.new_cache(str(tmp_path / 'cache.sqlite'), max_bytes=2**20)
+    # Lock não é serializável com pickle
+    resultado = {'lock': threading.Lock()}
+
+    assert result_cache.get_or_compute(cache, 'teste', 'SELECT 1', {}, 'v1', lambda: resultado) is resultado
+    assert pending_leases(cache) == 0
+    assert result_cache.stats(cache)['itens'] == 0
+
+def test_result_above_sqlite_blob_limit_is_not_stored(tmp_path):
+    cache = result_cache.new_cache(str(tmp_path / 'cache.sqlite'), max_bytes=2**20)
+    result_cache._connect(cache).setlimit(sqlite3.SQLITE_LIMIT_LENGTH, 1000)
+    resultado = b'x' * 5000
+
+    assert result_cache.get_or_compute(cache, 'teste', 'SELECT 1', {}, 'v1', lambda: resultado) == resultado
+    assert pending_leases(cache) == 0
+    assert result_cache.stats(cache)['itens'] == 0
+
+    # Abaixo dos dois limites continua sendo guardado
+    assert result_cache.get_or_compute(cache, 'teste', 'SELECT 2', {}, 'v1', lambda: b'ok') == b'ok'
+    assert result_cache.stats(cache)['itens'] == 1